@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_asgi_application()
+
+# Load the menu snapshot now rather than on the first menu request.
+from LittleLemonAPI.catalogue import warm_snapshot  # noqa: E402
+warm_snapshot()
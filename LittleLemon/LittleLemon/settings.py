@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+import django
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,13 +81,81 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment:
+#   DB_ENGINE          sqlite3 (default) or postgresql
+#   DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   DB_CONN_MAX_AGE    seconds to keep a connection open between requests
+#   DB_POOL            1 to use psycopg's connection pool (PostgreSQL, Django 5.1+)
+#   DB_SQLITE_TUNING   0 to skip the busy timeout and IMMEDIATE transactions
+#   DB_SQLITE_WAL      1 to switch the database file to WAL mode; off by default
+#                      because it rewrites the file's header and leaves
+#                      -wal/-shm files next to it (use it with your own DB_NAME)
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+    if os.environ.get('DB_SQLITE_TUNING', '1') == '1':
+        # sqlite3's timeout is the busy timeout: writers wait for the lock
+        # instead of failing straight away with "database is locked".
+        DATABASES['default']['OPTIONS'] = {'timeout': 20}
+        if django.VERSION >= (5, 1):
+            # Take the write lock at BEGIN. A deferred transaction that reads
+            # first cannot wait for it later and fails with "database is locked".
+            DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+        # Applied to every new connection by LittleLemonAPI.db.
+        SQLITE_PRAGMAS = {'busy_timeout': 20000}
+        if os.environ.get('DB_SQLITE_WAL') == '1':
+            # Readers no longer wait for writers; NORMAL is only safe with WAL.
+            SQLITE_PRAGMAS.update(journal_mode='WAL', synchronous='NORMAL')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('DB_NAME', 'littlelemon'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            },
+        }
+
+if DATABASES['default'].get('OPTIONS', {}).get('pool'):
+    # The pool hands out connections itself; persistent connections would
+    # pin one per thread.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# Local memory by default; set REDIS_URL to share the cache between workers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -138,9 +209,9 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'LittleLemonAPI.authentication.JWTAuthentication',
+        'LittleLemonAPI.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.SessionAuthentication',
     ),
 
     'DEFAULT_THROTTLE_RATES': {
@@ -151,15 +222,129 @@ REST_FRAMEWORK = {
     },
 
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'LittleLemonAPI.throttling.AnonRateThrottle',
+        'LittleLemonAPI.throttling.UserRateThrottle',
+        'LittleLemonAPI.throttling.ScopedRateThrottle',     # views with a throttle_scope, e.g. 'ten'
 ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 4
 }
 
+# Benchmarks against a running server need throttling out of the way.
+if os.environ.get('DISABLE_THROTTLING'):
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []
+
+# Throttle counters (LittleLemonAPI/throttling.py). The cache store shares
+# them between workers when the cache is Redis (REDIS_URL); with the local
+# memory cache each process counts on its own, so set THROTTLE_STORE=database
+# to keep them in the ThrottleCounter table instead. THROTTLE_WINDOW is
+# 'sliding' or 'fixed'.
+THROTTLE_STORE = 'LittleLemonAPI.throttling.CacheStore'
+if os.environ.get('THROTTLE_STORE') == 'database':
+    THROTTLE_STORE = 'LittleLemonAPI.throttling.DatabaseStore'
+THROTTLE_CACHE = 'default'
+THROTTLE_WINDOW = os.environ.get('THROTTLE_WINDOW', 'sliding')
+
 DJOSER = {
     "USER_ID_FIELD": "username",
     #"LOGIN_FIELD": "email",
 }
+
+# Seconds a user's resolved group names stay in the shared cache. A group
+# change evicts them from the cache of the process that made it only, so
+# with the per-process LocMemCache a demoted manager would keep their role
+# on every other worker until the entry expired: without REDIS_URL roles
+# are memoised for one request only. Only raise it with a shared cache.
+ROLE_CACHE_TTL = 300 if os.environ.get('REDIS_URL') else 0
+
+# Seconds an API token stays cached with its user (and its roles when
+# ROLE_CACHE_TTL is set). Entries are evicted on logout, token deletion,
+# user changes and group changes. JWT reads take the user's roles from the access token's claims, so a group
+# change reaches JWT reads when the token expires (SIMPLE_JWT's
+# ACCESS_TOKEN_LIFETIME, five minutes by default).
+AUTH_CACHE_TTL = 60
+
+# Cache alias and lifetime (seconds) of cached menu and category responses.
+CATALOGUE_CACHE = 'default'
+CATALOGUE_CACHE_TTL = 600
+# Workers keep an in-process copy of the menu (catalogue.Snapshot) and reload
+# it when the catalogue version changes, or after this many seconds in case
+# the version lives in a per-process cache (None: only on version changes).
+CATALOGUE_SNAPSHOT_MAX_AGE = 300
+
+# Order listings use keyset pagination on (date, id). Clients may ask for up
+# to ORDERS_MAX_PAGE_SIZE rows with ?page_size= and skip the COUNT(*) with
+# ?count=false.
+ORDERS_PAGE_SIZE = 4
+ORDERS_MAX_PAGE_SIZE = 100
+ORDERS_PAGINATION_COUNT = True
+
+# Rows fetched per round trip by the streaming order export.
+EXPORT_CHUNK_SIZE = 2000
+
+# Most lines accepted by one POST to /api/cart/menu-items/bulk/.
+CART_BULK_MAX_LINES = 100
+# Most of one menu item a cart line can hold.
+CART_MAX_QUANTITY = 100
+
+# Requests slower than this many milliseconds are logged to LittleLemonAPI.slow
+# with their slowest queries; None turns the log off. When METRICS_TOKEN is
+# set, /metrics requires "Authorization: Bearer <token>".
+METRICS_SLOW_REQUEST_MS = None
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Most order ids per UPDATE when /api/orders/dispatch/ writes assignments.
+DISPATCH_BATCH_SIZE = 500
+
+# Background jobs (LittleLemonAPI/jobs.py, run by "manage.py run_jobs"). A
+# failing job is retried after a random delay of up to
+# JOBS_BACKOFF_BASE ** attempt seconds (capped at JOBS_BACKOFF_MAX) and moves
+# to /api/jobs/dead/ after JOBS_MAX_ATTEMPTS. Jobs locked longer than
+# JOBS_LOCK_TIMEOUT seconds are treated as abandoned by a dead worker.
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_BASE = 2.0
+JOBS_BACKOFF_MAX = 3600.0
+JOBS_LOCK_TIMEOUT = 300
+JOBS_DEAD_LETTER_LIMIT = 100
+
+# Server-sent order events on /api/orders/events/ (LittleLemonAPI/push.py);
+# serve them from an ASGI server. The in-process broker only reaches streams
+# in the process that made the change; with REDIS_URL set, events are relayed
+# between processes over Redis pub/sub. Each stream buffers at most
+# PUSH_QUEUE_SIZE events and sends a keepalive every PUSH_KEEPALIVE seconds.
+PUSH_BROKER = 'LittleLemonAPI.push.InProcessBroker'
+if os.environ.get('REDIS_URL'):
+    PUSH_BROKER = 'LittleLemonAPI.push.RedisBroker'
+    PUSH_REDIS_URL = os.environ['REDIS_URL']
+PUSH_QUEUE_SIZE = 32
+PUSH_KEEPALIVE = 15
+
+# Manager reports on /api/reports/ read the daily rollup tables, which the
+# order jobs above keep current; rebuild them from the orders with
+# `python manage.py rebuild_rollups`. REPORTS_TOP_ITEMS is the default
+# length of the menu item ranking.
+REPORTS_TOP_ITEMS = 10
+
+# Serve GETs on the menu, category and order list endpoints from async views
+# (LittleLemonAPI/async_views.py). Only useful under an ASGI server, e.g.
+# ASYNC_READS=1 uvicorn LittleLemon.asgi:application; writes stay sync.
+ASYNC_READS = os.environ.get('ASYNC_READS', '').lower() in ('1', 'true', 'yes')
+
+# POSTs to /api/orders/, /api/cart/menu-items/ and /api/cart/menu-items/bulk/
+# sent with an Idempotency-Key header run once; retries with the same key get
+# the stored response for IDEMPOTENCY_KEY_TTL seconds (LittleLemonAPI/idempotency.py).
+# PUT/PATCH on /api/orders/<id> honour If-Match against the order's ETag;
+# ORDERS_REQUIRE_IF_MATCH makes the header mandatory.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+ORDERS_REQUIRE_IF_MATCH = False
+
+# Most order ids a delivery crew member can send to /api/orders/status/.
+ORDERS_BULK_STATUS_MAX = 100
+
+# `python manage.py archive_orders` (LittleLemonAPI/archive.py) moves
+# delivered orders older than ARCHIVE_AFTER_DAYS days to the archive tables,
+# ARCHIVE_BATCH_SIZE orders per transaction. Clients read them with
+# ?history=1 on /api/orders/ and /api/orders/export/.
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
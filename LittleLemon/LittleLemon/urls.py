@@ -16,11 +16,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView
+from LittleLemonAPI.metrics import metrics_view
+from LittleLemonAPI.serializers import TokenObtainPairSerializer
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('LittleLemonAPI.urls')),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
-    path('token/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/login/', TokenObtainPairView.as_view(serializer_class=TokenObtainPairSerializer), name='token_obtain_pair'),
+    path('metrics', metrics_view, name='metrics'),
 ]
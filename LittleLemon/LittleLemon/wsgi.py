@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_wsgi_application()
+
+# Load the menu snapshot now rather than on the first menu request.
+from LittleLemonAPI.catalogue import warm_snapshot  # noqa: E402
+warm_snapshot()
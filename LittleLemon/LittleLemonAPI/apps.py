@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LittleLemonAPI'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+        from .authentication import groups_changed, token_deleted, user_changed
+        from .catalogue import menu_changed
+        from .db import apply_sqlite_pragmas
+        from .metrics import install_query_timer
+        from .models import Category, MenuItem
+        from .search import category_saved, menuitem_deleted, menuitem_saved
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='littlelemon_sqlite_pragmas')
+        connection_created.connect(install_query_timer, dispatch_uid='littlelemon_query_timer')
+        install_query_timer()
+        post_delete.connect(token_deleted, sender=Token, dispatch_uid='littlelemon_token_deleted')
+        post_save.connect(user_changed, sender=User, dispatch_uid='littlelemon_user_saved')
+        post_delete.connect(user_changed, sender=User, dispatch_uid='littlelemon_user_deleted')
+        m2m_changed.connect(groups_changed, sender=User.groups.through, dispatch_uid='littlelemon_groups_changed')
+        post_save.connect(menuitem_saved, sender=MenuItem, dispatch_uid='littlelemon_menuitem_indexed')
+        post_delete.connect(menuitem_deleted, sender=MenuItem, dispatch_uid='littlelemon_menuitem_unindexed')
+        post_save.connect(category_saved, sender=Category, dispatch_uid='littlelemon_category_indexed')
+        for model in (MenuItem, Category):
+            post_save.connect(menu_changed, sender=model, dispatch_uid=f'littlelemon_{model.__name__}_saved')
+            post_delete.connect(menu_changed, sender=model, dispatch_uid=f'littlelemon_{model.__name__}_deleted')
@@ -0,0 +1,92 @@
+"""Moving completed orders out of the hot order tables.
+
+Listings, the dispatcher and the crew's views all read ``Order``, and
+nearly all of them only care about recent or open orders. ``archive_orders()``
+(the ``archive_orders`` command, run from cron) moves delivered orders older
+than ``ARCHIVE_AFTER_DAYS`` days, with their items, into ``ArchivedOrder``
+and ``ArchivedOrderItem``, keeping their ids. That keeps the hot tables and
+their indexes small enough to stay in memory.
+
+Each batch of ``ARCHIVE_BATCH_SIZE`` orders is copied and deleted in its own
+short transaction, so writers are never blocked for long and an
+interrupted run loses nothing: it resumes with the orders still left.
+
+Archived orders are read-only. ``GET /api/orders/<id>`` falls back to the
+archive, ``GET /api/orders/?history=1`` and the export with ``history=1``
+include it, and the sales rollups are rebuilt from both.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'ARCHIVE_AFTER_DAYS', 90)
+ARCHIVE_BATCH_SIZE = getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+
+ORDER_FIELDS = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'item_count', 'menuitem_count', 'version']
+ITEM_FIELDS = ['id', 'order', 'menuitem', 'quantity', 'unit_price', 'price']
+
+
+def wants_history(request):
+    # Archived orders are only listed for ?history=1
+    return request is not None and request.query_params.get('history', '').lower() in ('1', 'true', 'yes')
+
+
+def _copy(source, target, fields, key, ids, archived=None):
+    # INSERT INTO target SELECT ... FROM source WHERE key IN (ids): the rows
+    # never pass through Python.
+    quote = connection.ops.quote_name
+    columns = [quote(source._meta.get_field(name).column) for name in fields]
+    select = ', '.join(columns)
+    insert = select
+    params = []
+    if archived is not None:
+        insert += ', ' + quote(target._meta.get_field('archived').column)
+        select += ', %s'
+        params.append(connection.ops.adapt_datetimefield_value(archived))
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({insert}) '
+            f'SELECT {select} FROM {quote(source._meta.db_table)} WHERE {quote(key)} IN ({placeholders})',
+            params + list(ids),
+        )
+
+
+def archive_batch(ids):
+    """Move the delivered orders among ``ids`` to the archive; returns how many moved."""
+    with transaction.atomic():
+        # Re-read under lock: an order may have been reopened since it was picked.
+        ids = list(Order.objects.select_for_update().filter(pk__in=ids, status=True).values_list('pk', flat=True))
+        if not ids:
+            return 0
+        _copy(Order, ArchivedOrder, ORDER_FIELDS, 'id', ids, archived=timezone.now())
+        _copy(OrderItem, ArchivedOrderItem, ITEM_FIELDS, 'order_id', ids)
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(before=None, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Archive the delivered orders dated before ``before`` (default: ``ARCHIVE_AFTER_DAYS`` ago).
+
+    Returns the number of orders moved; ``progress`` is called with the
+    running total after each batch.
+    """
+    if before is None:
+        before = timezone.localdate() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    candidates = Order.objects.filter(status=True, date__lt=before).order_by('pk').values_list('pk', flat=True)
+
+    moved = 0
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(pk__gt=last_id)[:batch_size])
+        if not ids:
+            return moved
+        last_id = ids[-1]
+        moved += archive_batch(ids)
+        if progress is not None:
+            progress(moved)
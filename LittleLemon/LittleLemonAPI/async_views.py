@@ -0,0 +1,215 @@
+"""Async twins of the read-heavy views, for ASGI deployments.
+
+With ``ASYNC_READS`` on, ``read_view()`` routes GET and HEAD to the classes
+below and every other method to the unchanged sync view. Each async class
+extends its sync view, so querysets, serializers, permissions and throttles
+are shared; only dispatch, authentication, role lookup and the queryset
+evaluation run on the event loop with Django's async ORM.
+
+Compare the two deployments by pointing the same load at each, e.g.::
+
+    gunicorn -w 1 --threads 16 -b :8001 LittleLemon.wsgi
+    ASYNC_READS=1 uvicorn --port 8002 LittleLemon.asgi:application
+    python manage.py bench --url http://127.0.0.1:8002 --scenario browse_menu \
+        --scenario manager_listing --concurrency 64
+"""
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import push, views
+from .archive import wants_history
+from .catalogue import AsyncCatalogueCacheMixin, aget_snapshot
+from .pagination import AsyncPageNumberPagination
+from .roles import aget_roles, is_manager
+
+
+class AsyncReadAPIView:
+    """Async ``APIView.dispatch()`` for read-only views.
+
+    Permission classes are the sync ones: ``aget_roles`` fills the per-request
+    role memo first, so they run without touching the database.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.render(self.response)
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+
+        await self.aperform_authentication(request)
+        await aget_roles(request.user)
+        self.check_permissions(request)
+        await self.acheck_throttles(request)
+
+    async def acheck_throttles(self, request):
+        # APIView.check_throttles(), awaiting the counter stores.
+        throttle_durations = []
+        for throttle in self.get_throttles():
+            if hasattr(throttle, 'aallow_request'):
+                allowed = await throttle.aallow_request(request, self)
+            else:
+                allowed = await sync_to_async(throttle.allow_request)(request, self)
+            if not allowed:
+                throttle_durations.append(throttle.wait())
+
+        if throttle_durations:
+            durations = [duration for duration in throttle_durations if duration is not None]
+            self.throttled(request, max(durations, default=None))
+
+    async def aperform_authentication(self, request):
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    def render(self, response):
+        # Django renders a TemplateResponse returned to the async handler in a
+        # worker thread; render it here and hand back a plain HttpResponse.
+        if not hasattr(response, 'render') or response.is_rendered:
+            return response
+        response.render()
+        rendered = HttpResponse(response.content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fast = getattr(self, 'fast_serializer', None)
+        if fast is not None:
+            queryset = fast.values(queryset)
+        serialize = fast.many if fast is not None else lambda rows: self.get_serializer(rows, many=True).data
+
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(serialize(page))
+        rows = [row async for row in queryset]
+        return Response(serialize(rows))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instance).data)
+
+
+class AsyncListAPIView(AsyncReadAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+
+class AsyncRetrieveAPIView(AsyncReadAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        return await self.aretrieve(request, *args, **kwargs)
+
+
+class AsyncSnapshotMixin:
+    # The views' SnapshotMixin, with an async version check.
+
+    async def alist(self, request, *args, **kwargs):
+        response = self.snapshot_list(await aget_snapshot(), request)
+        if response is None:
+            response = await super().alist(request, *args, **kwargs)
+        return response
+
+    async def aretrieve(self, request, *args, **kwargs):
+        response = self.snapshot_retrieve(await aget_snapshot())
+        if response is None:
+            response = await super().aretrieve(request, *args, **kwargs)
+        return response
+
+
+class MenuCategoryView(AsyncCatalogueCacheMixin, AsyncSnapshotMixin, AsyncListAPIView, views.MenuCategoryView):
+    pagination_class = AsyncPageNumberPagination
+
+
+class MenuItemsView(AsyncCatalogueCacheMixin, AsyncSnapshotMixin, AsyncListAPIView, views.MenuItemsView):
+    pagination_class = AsyncPageNumberPagination
+
+
+class SingleMenuItem(AsyncCatalogueCacheMixin, AsyncSnapshotMixin, AsyncRetrieveAPIView, views.SingleMenuItem):
+    pass
+
+
+class OrderView(AsyncListAPIView, views.OrderView):
+
+    async def alist(self, request, *args, **kwargs):
+        if not wants_history(request):
+            return await super().alist(request, *args, **kwargs)
+        querysets = [self.filter_queryset(self.get_queryset()), self.get_archive_queryset()]
+        page = await self.paginator.apaginate_querysets(querysets, request, view=self)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class OrderEventsView(AsyncReadAPIView, APIView):
+    """Server-sent events for the orders the user may see (see push.py)."""
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        broker = push.get_broker()
+        subscription = broker.subscribe(user.pk, manager=is_manager(user))
+        response = StreamingHttpResponse(push.stream(broker, subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def read_view(sync_view_class, async_view_class):
+    """Send GET and HEAD to ``async_view_class`` and the rest to the sync view."""
+    read = async_view_class.as_view()
+    write = sync_to_async(sync_view_class.as_view())
+
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    # Like APIView.as_view(); DRF's authentication enforces CSRF for sessions.
+    view.csrf_exempt = True
+    view.cls = sync_view_class
+    return view
@@ -0,0 +1,199 @@
+"""The project's authentication classes, with async twins for the ASGI read views.
+
+``TokenAuthentication`` caches each resolved token together with its user
+and roles for ``AUTH_CACHE_TTL`` seconds; the receivers at the bottom of
+this module evict entries when a token is deleted (logout), a user is
+saved or deleted, or group membership changes. ``JWTAuthentication`` builds
+the user from the token's claims on read-only requests and only loads it
+from the database for writes. Together with the role cache this makes a
+warm read run no authentication queries at all.
+
+``aauthenticate`` does the same work with Django's async ORM and cache
+API, so ``AsyncReadAPIView`` can authenticate without a thread hop.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt import authentication as jwt_authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .roles import ROLE_CACHE_TTL, aget_roles, get_roles, invalidate_roles, invalidate_roles_for
+
+AUTH_CACHE_TTL = getattr(settings, 'AUTH_CACHE_TTL', 60)
+
+# Claims added to access tokens by serializers.TokenObtainPairSerializer.
+USERNAME_CLAIM = 'username'
+ROLES_CLAIM = 'roles'
+
+
+def _token_cache_key(key):
+    return f'littlelemon:token:{key}'
+
+
+class JWTAuthentication(jwt_authentication.JWTAuthentication):
+
+    def authenticate(self, request):
+        validated_token = self.get_token(request)
+        if validated_token is None:
+            return None
+        user = self.get_claims_user(request, validated_token) or self.get_user(validated_token)
+        return user, validated_token
+
+    async def aauthenticate(self, request):
+        validated_token = self.get_token(request)
+        if validated_token is None:
+            return None
+        user = self.get_claims_user(request, validated_token) or await self.aget_user(validated_token)
+        return user, validated_token
+
+    def get_token(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return self.get_validated_token(raw_token)
+
+    def get_claims_user(self, request, validated_token):
+        # Reads trust the signed claims: an unsaved User carrying the id and
+        # roles stands in for the row. Writes, and tokens issued without a
+        # roles claim, load the user from the database as usual.
+        if request.method not in SAFE_METHODS or ROLES_CLAIM not in validated_token:
+            return None
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = self.user_model(**{
+            jwt_settings.USER_ID_FIELD: user_id,
+            self.user_model.USERNAME_FIELD: validated_token.get(USERNAME_CLAIM, ''),
+        })
+        user._roles_cache = frozenset(validated_token[ROLES_CLAIM])
+        return user
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+
+    def get_key(self, request):
+        # The header parsing of TokenAuthentication.authenticate(), without the lookup.
+        auth = authentication.get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.'))
+
+    def authenticate_credentials(self, key):
+        cache_key = _token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            token, roles = cached
+            if roles is not None:
+                token.user._roles_cache = roles
+            return (token.user, token)
+
+        user, token = super().authenticate_credentials(key)
+        # Roles ride along only where they may be shared (see roles.py).
+        cache.set(cache_key, (token, get_roles(user) if ROLE_CACHE_TTL else None), AUTH_CACHE_TTL)
+        return (user, token)
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        cache_key = _token_cache_key(key)
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            token, roles = cached
+            if roles is not None:
+                token.user._roles_cache = roles
+            return (token.user, token)
+
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        roles = await aget_roles(token.user) if ROLE_CACHE_TTL else None
+        await cache.aset(cache_key, (token, roles), AUTH_CACHE_TTL)
+        return (token.user, token)
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+
+    async def aauthenticate(self, request):
+        # Only used for safe methods, so there is no CSRF check to run.
+        if hasattr(request._request, 'auser'):
+            user = await request._request.auser()
+        else:  # Django < 5.0, or no AuthenticationMiddleware
+            user = await sync_to_async(getattr)(request._request, 'user', None)
+        if not user or not user.is_active:
+            return None
+        return (user, None)
+
+
+def forget_users(user_ids):
+    """Drop cached tokens and roles of the given users."""
+    keys = Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True)
+    cache.delete_many([_token_cache_key(key) for key in keys])
+    invalidate_roles_for(user_ids)
+
+
+# Receivers connected in LittlelemonapiConfig.ready().
+
+def token_deleted(sender, instance, **kwargs):
+    cache.delete(_token_cache_key(instance.key))
+
+
+def user_changed(sender, instance, **kwargs):
+    forget_users([instance.pk])
+    invalidate_roles(instance)
+
+
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add(...): the instance is the user.
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            forget_users([instance.pk])
+            invalidate_roles(instance)
+    elif action in ('post_add', 'post_remove'):
+        # group.user_set.add(...): pk_set holds the users.
+        forget_users(list(pk_set))
+    elif action == 'pre_clear':
+        forget_users(list(instance.user_set.values_list('pk', flat=True)))
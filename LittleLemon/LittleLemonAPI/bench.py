@@ -0,0 +1,282 @@
+"""Load generator and scenarios behind the ``seed_data`` and ``bench`` commands.
+
+Every scenario talks to the API through a client object, so the same code
+runs in-process against the Django test client (with per-request query
+counts) or over HTTP against a locally started server.
+"""
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .roles import MANAGER, DELIVERY_CREW
+from .search import index_items
+
+USER_PREFIX = 'bench-'
+
+
+def seed(users=50, crew=5, categories=5, items=100, carts=20, orders=500, seed_value=0):
+    """Create benchmark users, menu, carts and orders; returns a summary dict.
+
+    All rows are created with bulk inserts. Users get API tokens but no
+    usable password, so seeding thousands of them stays fast.
+    """
+    rng = random.Random(seed_value)
+    with transaction.atomic():
+        manager_group, _ = Group.objects.get_or_create(name=MANAGER)
+        crew_group, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+
+        start = User.objects.filter(username__startswith=USER_PREFIX).count()
+        names = [f'{USER_PREFIX}manager-{start}']
+        names += [f'{USER_PREFIX}crew-{start + i}' for i in range(crew)]
+        names += [f'{USER_PREFIX}user-{start + i}' for i in range(users)]
+        User.objects.bulk_create(User(username=name, password='!') for name in names)
+        created = {user.username: user for user in User.objects.filter(username__in=names)}
+        manager = created[names[0]]
+        crew_members = [created[name] for name in names[1:crew + 1]]
+        customers = [created[name] for name in names[crew + 1:]]
+
+        manager.groups.add(manager_group)
+        crew_group.user_set.add(*crew_members)
+        Token.objects.bulk_create(Token(user=user, key=Token.generate_key()) for user in created.values())
+
+        category_rows = Category.objects.bulk_create(
+            Category(slug=f'bench-{start}-{i}', title=f'Bench category {i}') for i in range(categories))
+        menu = MenuItem.objects.bulk_create(
+            MenuItem(
+                title=f'Bench item {i}',
+                price=Decimal(rng.randint(200, 4000)) / 100,
+                featured=rng.random() < 0.1,
+                category=rng.choice(category_rows),
+            )
+            for i in range(items)
+        )
+        # bulk_create() sends no post_save, so index the new items here.
+        index_items([item.pk for item in menu])
+
+        cart_rows = []
+        for customer in customers[:carts]:
+            for item in rng.sample(menu, min(len(menu), rng.randint(1, 8))):
+                quantity = rng.randint(1, 4)
+                cart_rows.append(Cart(user=customer, menuitem=item, quantity=quantity,
+                                      unit_price=item.price, price=item.price * quantity))
+        Cart.objects.bulk_create(cart_rows)
+
+        order_lines = []
+        for _ in range(orders):
+            lines = [(item, rng.randint(1, 3)) for item in rng.sample(menu, min(len(menu), rng.randint(1, 5)))]
+            order_lines.append((
+                Order(
+                    user=rng.choice(customers),
+                    delivery_crew=rng.choice(crew_members) if crew_members and rng.random() < 0.6 else None,
+                    status=rng.random() < 0.3,
+                    total=sum(item.price * quantity for item, quantity in lines),
+                    item_count=sum(quantity for _, quantity in lines),
+                    menuitem_count=len(lines),
+                ),
+                lines,
+            ))
+        order_rows = Order.objects.bulk_create(order for order, _ in order_lines)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=quantity,
+                      unit_price=item.price, price=item.price * quantity)
+            for order, (_, lines) in zip(order_rows, order_lines)
+            for item, quantity in lines
+        )
+
+    return {
+        'users': len(created), 'categories': len(category_rows), 'menu_items': len(menu),
+        'cart_lines': len(cart_rows), 'orders': len(order_rows),
+    }
+
+
+class InProcessClient:
+    """Calls the API through DRF's test client and counts queries per request."""
+
+    counts_queries = True
+
+    def __init__(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient(raise_request_exception=False)
+
+    def request(self, method, path, token, data=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(self.client, method.lower())(path, data, format='json')
+            elapsed = time.perf_counter() - started
+        is_json = response.content and response.get('Content-Type', '').startswith('application/json')
+        body = response.json() if is_json else None
+        return response.status_code, body, elapsed, len(captured.captured_queries)
+
+
+class HTTPClient:
+    """Calls a running server over HTTP; query counts are not available."""
+
+    counts_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token, data=None):
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers={
+            'Authorization': f'Token {token}',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        })
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, payload = error.code, error.read()
+        elapsed = time.perf_counter() - started
+        try:
+            payload = json.loads(payload) if payload else None
+        except ValueError:
+            payload = None
+        return status, payload, elapsed, None
+
+
+class Recorder:
+
+    def __init__(self, client):
+        self.client = client
+        self.samples = defaultdict(list)
+
+    def __call__(self, name, method, path, token, data=None):
+        status, body, elapsed, queries = self.client.request(method, path, token, data)
+        self.samples[name].append((elapsed, queries, status))
+        return status, body
+
+
+class Fixtures:
+    """Benchmark users, tokens and ids, loaded once from the database."""
+
+    def __init__(self):
+        tokens = dict(Token.objects.filter(user__username__startswith=USER_PREFIX)
+                      .values_list('user__username', 'key'))
+        users = User.objects.filter(username__startswith=USER_PREFIX)
+        managers = [tokens[u.username] for u in users.filter(groups__name=MANAGER)]
+        self.crew = {u.pk: tokens[u.username] for u in users.filter(groups__name=DELIVERY_CREW)}
+        self.customers = [(u.pk, tokens[u.username]) for u in users.filter(groups__isnull=True)]
+        self.menu = list(MenuItem.objects.values_list('pk', flat=True))
+        self.assigned = defaultdict(list)
+        for order_id, crew_id in (Order.objects.filter(delivery_crew__in=self.crew)
+                                  .values_list('pk', 'delivery_crew')[:10000]):
+            self.assigned[crew_id].append(order_id)
+        if not (managers and self.crew and self.customers and self.menu):
+            raise ValueError("No benchmark data found; run the seed_data command first.")
+        self.manager = managers[0]
+
+
+def browse_menu(record, fixtures, rng):
+    _, token = rng.choice(fixtures.customers)
+    record('browse_menu/category', 'GET', '/api/category/', token)
+    record('browse_menu/menu_items', 'GET', f'/api/menu-items/?page={rng.randint(1, 5)}', token)
+    record('browse_menu/menu_item', 'GET', f'/api/menu-items/{rng.choice(fixtures.menu)}', token)
+
+
+def fill_cart(record, fixtures, rng):
+    # DELETE answers 403 when the cart is already empty; that shows up as a
+    # client error, not a failure.
+    _, token = rng.choice(fixtures.customers)
+    record('fill_cart/clear', 'DELETE', '/api/cart/menu-items/', token)
+    for menuitem in rng.sample(fixtures.menu, min(len(fixtures.menu), 5)):
+        record('fill_cart/add', 'POST', '/api/cart/menu-items/', token,
+               {'menuitem': menuitem, 'quantity': rng.randint(1, 3)})
+    record('fill_cart/list', 'GET', '/api/cart/menu-items/', token)
+
+
+def checkout(record, fixtures, rng):
+    user_id, token = rng.choice(fixtures.customers)
+    lines = [{'menuitem': menuitem, 'quantity': rng.randint(1, 3)}
+             for menuitem in rng.sample(fixtures.menu, min(len(fixtures.menu), 5))]
+    record('checkout/bulk_cart', 'POST', '/api/cart/menu-items/bulk/', token, {'lines': lines})
+    record('checkout/order', 'POST', '/api/orders/', token, {'user': user_id})
+
+
+def manager_listing(record, fixtures, rng):
+    path = '/api/orders/?page_size=20'
+    for _ in range(3):
+        status, body = record('manager_listing/orders', 'GET', path, fixtures.manager)
+        if status != 200 or not body or not body.get('next'):
+            break
+        path = body['next'][body['next'].index('/api/'):]
+
+
+def crew_status_update(record, fixtures, rng):
+    crew_id, token = rng.choice(list(fixtures.crew.items()))
+    if not fixtures.assigned[crew_id]:
+        return
+    order_id = rng.choice(fixtures.assigned[crew_id])
+    record('crew_status_update/patch', 'PATCH', f'/api/orders/{order_id}', token, {'status': 1})
+
+
+SCENARIOS = {
+    'browse_menu': browse_menu,
+    'fill_cart': fill_cart,
+    'checkout': checkout,
+    'manager_listing': manager_listing,
+    'crew_status_update': crew_status_update,
+}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile on an already sorted list.
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, wall_time):
+    results = {}
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+        queries = [count for _, count, _ in rows if count is not None]
+        results[name] = {
+            'requests': len(rows),
+            'client_errors': sum(1 for _, _, status in rows if 400 <= status < 500),
+            'server_errors': sum(1 for _, _, status in rows if status >= 500),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'mean_ms': sum(latencies) / len(latencies),
+            'queries_per_request': sum(queries) / len(queries) if queries else None,
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {
+        'requests': total,
+        'wall_time_s': wall_time,
+        'throughput_rps': total / wall_time if wall_time else None,
+        'endpoints': results,
+    }
+
+
+def run(client, scenarios, iterations, concurrency=1, seed_value=0):
+    """Run each scenario ``iterations`` times and return the summary dict."""
+    fixtures = Fixtures()
+    recorder = Recorder(client)
+    jobs = [(SCENARIOS[name], random.Random(seed_value * 1000003 + i))
+            for i in range(iterations) for name in scenarios]
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda job: job[0](recorder, fixtures, job[1]), jobs))
+    else:
+        for scenario, rng in jobs:
+            scenario(recorder, fixtures, rng)
+    return summarize(recorder.samples, time.perf_counter() - started)
@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cart, MenuItem
+
+MAX_QUANTITY = getattr(settings, 'CART_MAX_QUANTITY', 100)
+
+
+def decimal_limit(model, name):
+    # The largest value a DecimalField column can hold, e.g. 9999.99.
+    field = model._meta.get_field(name)
+    return Decimal(10) ** (field.max_digits - field.decimal_places) - Decimal(10) ** -field.decimal_places
+
+
+MAX_PRICE = decimal_limit(Cart, 'price')
+
+
+def price_error(price):
+    if price > MAX_PRICE:
+        return f"The line would cost {price}; a cart line can cost at most {MAX_PRICE}."
+    return None
+
+
+def _parse_line(line):
+    if not isinstance(line, dict):
+        return None, None, "Each line must be an object with menuitem and quantity."
+    try:
+        menuitem_id = int(line['menuitem'])
+        quantity = int(line.get('quantity', 1))
+    except (KeyError, TypeError, ValueError):
+        return None, None, "menuitem and quantity must be integers."
+    if not 0 <= quantity <= MAX_QUANTITY:
+        return menuitem_id, None, f"quantity must be between 0 and {MAX_QUANTITY}."
+    return menuitem_id, quantity, None
+
+
+def bulk_update_cart(user, lines):
+    """Upsert or remove many cart lines at once and report on each of them.
+
+    A quantity of 0 removes the line. Every menu item is priced by one query
+    against the menu table (not the catalogue snapshot, which another
+    worker may have changed since it was loaded) and every upsert goes out
+    as a single ``INSERT ... ON CONFLICT (menuitem, user) DO UPDATE``. If a menu item
+    appears more than once, the last line wins.
+    """
+    parsed = [_parse_line(line) for line in lines]
+    ids = {menuitem_id for menuitem_id, _, error in parsed if error is None}
+    prices = dict(MenuItem.objects.filter(pk__in=ids).values_list('pk', 'price')) if ids else {}
+
+    results = []
+    upserts = {}
+    removals = set()
+    for menuitem_id, quantity, error in parsed:
+        if error is None and menuitem_id not in prices:
+            error = f"Menu item {menuitem_id} does not exist."
+        if error is None and quantity:
+            error = price_error(prices[menuitem_id] * quantity)
+        if error is not None:
+            results.append({"menuitem": menuitem_id, "status": "error", "error": error})
+            continue
+
+        if quantity == 0:
+            upserts.pop(menuitem_id, None)
+            removals.add(menuitem_id)
+            results.append({"menuitem": menuitem_id, "status": "removed"})
+        else:
+            removals.discard(menuitem_id)
+            price = prices[menuitem_id]
+            upserts[menuitem_id] = Cart(
+                user=user,
+                menuitem_id=menuitem_id,
+                quantity=quantity,
+                unit_price=price,
+                price=price * quantity,
+            )
+            results.append({"menuitem": menuitem_id, "status": "saved", "quantity": quantity,
+                            "unit_price": str(price), "price": str(price * quantity)})
+
+    with transaction.atomic():
+        if upserts:
+            Cart.objects.bulk_create(
+                upserts.values(),
+                update_conflicts=True,
+                unique_fields=['menuitem', 'user'],
+                update_fields=['quantity', 'unit_price', 'price'],
+            )
+        if removals:
+            Cart.objects.filter(user=user, menuitem_id__in=removals).delete()
+
+    return results
@@ -0,0 +1,351 @@
+import hashlib
+import logging
+import threading
+import time
+from operator import attrgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fastpath import money
+from .models import Category, MenuItem
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_CACHE = getattr(settings, 'CATALOGUE_CACHE', 'default')
+CATALOGUE_CACHE_TTL = getattr(settings, 'CATALOGUE_CACHE_TTL', 600)
+CATALOGUE_SNAPSHOT_MAX_AGE = getattr(settings, 'CATALOGUE_SNAPSHOT_MAX_AGE', 300)
+
+VERSION_KEY = 'littlelemon:catalogue:version'
+
+
+def _cache():
+    return caches[CATALOGUE_CACHE]
+
+
+def get_version():
+    # The version is the time of the last menu write in microseconds, so it
+    # doubles as Last-Modified and never goes backwards if the key is evicted.
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        _cache().add(VERSION_KEY, time.time_ns() // 1000, None)
+        version = _cache().get(VERSION_KEY)
+    return version
+
+
+async def aget_version():
+    version = await _cache().aget(VERSION_KEY)
+    if version is None:
+        await _cache().aadd(VERSION_KEY, time.time_ns() // 1000, None)
+        version = await _cache().aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    version = max(time.time_ns() // 1000, get_version() + 1)
+    _cache().set(VERSION_KEY, version, None)
+    return version
+
+
+def cache_entry(request, version):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'littlelemon:catalogue:{version}:{digest}'
+    etag = f'"{version}-{digest[:12]}"'
+    return key, etag, version // 1000000
+
+
+def with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class CatalogueCacheMixin:
+    """Serve GETs from a cache keyed on the query string and catalogue version.
+
+    Authentication, permissions and throttling still run on every request;
+    only the queryset and serialization work is skipped. Saving or deleting
+    a menu item or category bumps the version once the transaction commits
+    (see ``menu_changed()``), which orphans every cached entry at once.
+    """
+
+    def get(self, request, *args, **kwargs):
+        key, etag, last_modified = cache_entry(request, get_version())
+
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            response = not_modified
+        else:
+            data = _cache().get(key)
+            if data is None:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                _cache().set(key, response.data, CATALOGUE_CACHE_TTL)
+            else:
+                response = Response(data)
+
+        return with_validators(response, etag, last_modified)
+
+
+class AsyncCatalogueCacheMixin:
+    """``CatalogueCacheMixin`` for ``AsyncReadAPIView`` subclasses."""
+
+    async def get(self, request, *args, **kwargs):
+        key, etag, last_modified = cache_entry(request, await aget_version())
+
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return with_validators(not_modified, etag, last_modified)
+
+        data = await _cache().aget(key)
+        if data is None:
+            response = await super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            await _cache().aset(key, response.data, CATALOGUE_CACHE_TTL)
+        else:
+            response = Response(data)
+        return with_validators(response, etag, last_modified)
+
+
+class CatalogueItem:
+    __slots__ = ('id', 'title', 'price', 'featured', 'category')
+
+    def __init__(self, id, title, price, featured, category):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.featured = featured
+        self.category = category
+
+    def represent(self):
+        # MenuItemSerializer's output, like fastpath.MenuItemValues.
+        category = self.category
+        return {
+            'id': self.id,
+            'title': self.title,
+            'price': money(self.price),
+            'featured': self.featured,
+            'category': {'id': category.id, 'slug': category.slug, 'title': category.title},
+        }
+
+
+class CatalogueCategory:
+    __slots__ = ('id', 'slug', 'title')
+
+    def __init__(self, id, slug, title):
+        self.id = id
+        self.slug = slug
+        self.title = title
+
+    def represent(self):
+        return {'id': self.id, 'slug': self.slug, 'title': self.title}
+
+
+class Snapshot:
+    """An immutable copy of the menu, indexed for the menu endpoints and cart pricing.
+
+    ``items`` is in id order; ``by_category`` and ``featured`` keep that order
+    and ``by_price`` is sorted by (price, id).
+    """
+    __slots__ = ('version', 'loaded', 'categories', 'category_by_id', 'category_by_slug',
+                 'items', 'by_id', 'by_category', 'featured', 'by_price')
+
+    def __init__(self, version, categories, items):
+        self.version = version
+        self.loaded = time.monotonic()
+        self.categories = tuple(categories)
+        self.category_by_id = {category.id: category for category in self.categories}
+        self.category_by_slug = {}
+        for category in self.categories:
+            # Slugs are not unique; the first category with a slug wins.
+            self.category_by_slug.setdefault(category.slug, category)
+        self.items = tuple(items)
+        self.by_id = {item.id: item for item in self.items}
+        by_category = {}
+        for item in self.items:
+            by_category.setdefault(item.category.id, []).append(item)
+        self.by_category = {category_id: tuple(rows) for category_id, rows in by_category.items()}
+        self.featured = tuple(item for item in self.items if item.featured)
+        self.by_price = tuple(sorted(self.items, key=attrgetter('price', 'id')))
+
+    @classmethod
+    def load(cls, version):
+        categories = [CatalogueCategory(*row) for row in
+                      Category.objects.order_by('id').values_list('id', 'slug', 'title')]
+        by_id = {category.id: category for category in categories}
+        items = [
+            CatalogueItem(pk, title, price, featured, by_id[category_id])
+            for pk, title, price, featured, category_id in
+            MenuItem.objects.order_by('id').values_list('id', 'title', 'price', 'featured', 'category_id')
+        ]
+        return cls(version, categories, items)
+
+    def select(self, category=None, featured=None, ordering=()):
+        """Items in ``category`` (a CatalogueCategory) and/or with ``featured``, sorted by ``ordering``."""
+        if category is not None:
+            rows = self.by_category.get(category.id, ())
+            if featured is not None:
+                rows = [item for item in rows if item.featured == featured]
+        elif featured:
+            rows = self.featured
+        elif featured is not None:
+            rows = [item for item in self.items if not item.featured]
+        elif list(ordering) in (['price'], ['-price']):
+            return list(self.by_price if ordering[0] == 'price' else reversed(self.by_price))
+        else:
+            rows = self.items
+
+        rows = list(rows)
+        # Stable sorts, last key first, give the same order as ORDER BY a, b.
+        for term in reversed(ordering):
+            field = term.lstrip('-')
+            rows.sort(key=attrgetter('category.id' if field == 'category' else field), reverse=term.startswith('-'))
+        return rows
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The current snapshot, reloaded first if the catalogue version moved on."""
+    version = get_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version and not _expired(snapshot):
+        return snapshot
+    return _reload(version)
+
+
+async def aget_snapshot():
+    version = await aget_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version and not _expired(snapshot):
+        return snapshot
+    return await sync_to_async(_reload)(version)
+
+
+def _expired(snapshot):
+    return CATALOGUE_SNAPSHOT_MAX_AGE is not None and time.monotonic() - snapshot.loaded > CATALOGUE_SNAPSHOT_MAX_AGE
+
+
+def _reload(version):
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version or _expired(_snapshot):
+            _snapshot = Snapshot.load(version)
+        return _snapshot
+
+
+def warm_snapshot():
+    # Called from wsgi.py and asgi.py so workers load the menu before their
+    # first request. Before the first migrate there is nothing to load.
+    try:
+        get_snapshot()
+    except DatabaseError:
+        logger.warning("Could not load the catalogue snapshot; it will load on the first menu read.")
+
+
+def menu_changed(sender, **kwargs):
+    # Receiver for saves and deletes of menu items and categories, connected
+    # in LittlelemonapiConfig.ready(). Bumping after commit keeps other
+    # workers from reloading the snapshot before the change is visible.
+    transaction.on_commit(bump_version)
+
+
+ORDERING_FIELDS = ('id', 'title', 'price', 'featured', 'category')
+
+
+def parse_ordering(value):
+    # Like OrderingFilter: unknown fields are dropped.
+    terms = [term.strip() for term in value.split(',') if term.strip()]
+    return [term for term in terms if term.lstrip('-') in ORDERING_FIELDS]
+
+
+class SnapshotMixin:
+    """Menu reads answered from the in-process snapshot instead of the database.
+
+    ``snapshot_rows()`` returns the objects to list, or None when the request
+    needs the database (e.g. ``?search=``); ``snapshot_list()`` then returns
+    None and the view falls back to its queryset.
+    """
+
+    def snapshot_rows(self, snapshot, request):
+        return None
+
+    def snapshot_list(self, snapshot, request):
+        rows = self.snapshot_rows(snapshot, request)
+        if rows is None:
+            return None
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response([row.represent() for row in page])
+        return Response([row.represent() for row in rows])
+
+    def snapshot_retrieve(self, snapshot):
+        # None on a miss: the item may be newer than this worker's snapshot.
+        item = snapshot.by_id.get(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        if item is None:
+            return None
+        return Response(item.represent())
+
+    def list(self, request, *args, **kwargs):
+        response = self.snapshot_list(get_snapshot(), request)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.snapshot_retrieve(get_snapshot())
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return response
+
+
+class MenuItemSnapshotMixin(SnapshotMixin):
+    """``?category=`` (id or slug), ``?featured=`` and ordering from the snapshot.
+
+    ``get_queryset()`` applies the same filters, for the requests that fall
+    back to the database.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if params.get('category'):
+            value = params['category']
+            queryset = queryset.filter(category_id=int(value)) if value.isdigit() else queryset.filter(category__slug=value)
+        if 'featured' in params:
+            queryset = queryset.filter(featured=params['featured'].lower() in ('1', 'true'))
+        return queryset
+
+    def snapshot_rows(self, snapshot, request):
+        params = request.query_params
+        if params.get(api_settings.SEARCH_PARAM, '').strip():
+            return None
+
+        category = None
+        if params.get('category'):
+            value = params['category']
+            category = (snapshot.category_by_id.get(int(value)) if value.isdigit()
+                        else snapshot.category_by_slug.get(value))
+            if category is None:
+                return []
+        featured = None
+        if 'featured' in params:
+            featured = params['featured'].lower() in ('1', 'true')
+        ordering = parse_ordering(params.get(api_settings.ORDERING_PARAM, ''))
+        return snapshot.select(category, featured, ordering)
+
+
+class CategorySnapshotMixin(SnapshotMixin):
+
+    def snapshot_rows(self, snapshot, request):
+        return list(snapshot.categories)
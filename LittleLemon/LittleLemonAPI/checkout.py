@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from rest_framework.exceptions import ValidationError
+
+from .cart import decimal_limit
+from .jobs import ORDER_CREATED, enqueue
+from .models import Cart, Order, OrderItem
+
+
+def checkout(user, create_order=None):
+    """Turn the user's cart into an order in a single transaction.
+
+    The cart rows are locked for the duration of the checkout so a concurrent
+    cart edit cannot change the lines between totalling and copying them.
+    ``create_order`` is called with the order summary (``total``,
+    ``item_count`` and ``menuitem_count``) as keyword arguments and must
+    return the saved ``Order``; it defaults to a plain ``Order.objects.create``.
+    """
+    if create_order is None:
+        create_order = lambda **summary: Order.objects.create(user=user, **summary)
+
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user)
+        lines = list(cart.values_list('id', 'menuitem_id', 'quantity', 'unit_price', 'price'))
+        if not lines:
+            raise ValidationError({"error": "Your cart is empty."})
+
+        # Only the locked lines are totalled and cleared; anything added while
+        # the checkout runs stays in the cart.
+        checked_out = Cart.objects.filter(pk__in=[line[0] for line in lines])
+        summary = checked_out.aggregate(
+            total=Sum('price'),
+            item_count=Sum('quantity'),
+            menuitem_count=Count('id'),
+        )
+        if summary['total'] > decimal_limit(Order, 'total'):
+            raise ValidationError({"error": f"An order can cost at most {decimal_limit(Order, 'total')}."})
+        order = create_order(**summary)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                menuitem_id=menuitem_id,
+                quantity=quantity,
+                unit_price=unit_price,
+                price=price,
+            )
+            for _, menuitem_id, quantity, unit_price, price in lines
+        ])
+        checked_out.delete()
+        enqueue(ORDER_CREATED, order_id=order.pk)
+
+    return order
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models import F
+
+from .jobs import ORDER_STATUS_CHANGED, enqueue_many
+from .models import Order
+from .push import order_changes
+
+
+def bulk_update_status(crew, order_ids, status):
+    """Set the status of many of ``crew``'s orders at once and report on each of them.
+
+    One locked read finds which of the orders are assigned to ``crew`` and
+    one ``UPDATE ... WHERE id IN`` writes the ones whose status changes,
+    bumping their versions. The status change jobs go out in one INSERT and
+    the push events after commit, as for a single update.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    with transaction.atomic():
+        assigned = {
+            pk: (user_id, current)
+            for pk, user_id, current in Order.objects.select_for_update()
+            .filter(pk__in=order_ids, delivery_crew=crew).values_list('pk', 'user_id', 'status')
+        }
+        changed = [pk for pk, (_, current) in assigned.items() if current != status]
+        if changed:
+            Order.objects.filter(pk__in=changed).update(status=status, version=F('version') + 1)
+            enqueue_many(ORDER_STATUS_CHANGED, [
+                {'order_id': pk, 'status': status, 'delivery_crew': crew.pk,
+                 'previous_status': assigned[pk][1], 'previous_crew': crew.pk} for pk in changed
+            ])
+            order_changes([(pk, assigned[pk][0], crew.pk, status) for pk in changed])
+
+    results = []
+    for pk in order_ids:
+        if pk not in assigned:
+            results.append({"order": pk, "result": "error", "error": "Order not found or not assigned to you."})
+        elif assigned[pk][1] == status:
+            results.append({"order": pk, "result": "unchanged"})
+        else:
+            results.append({"order": pk, "result": "updated"})
+    return results
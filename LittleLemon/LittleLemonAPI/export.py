@@ -0,0 +1,82 @@
+import csv
+import heapq
+import json
+from itertools import groupby
+
+from django.conf import settings
+
+from .models import ArchivedOrder, Order
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+ORDER_COLUMNS = ['id', 'date', 'user_id', 'delivery_crew_id', 'status', 'total']
+ITEM_COLUMNS = ['menuitem_id', 'menuitem_title', 'quantity', 'unit_price', 'price']
+
+# One row per order item; orders without items still appear once, with
+# empty item columns, because the reverse relation is a LEFT OUTER JOIN.
+_FIELDS = ORDER_COLUMNS + [
+    'orderitem__menuitem_id',
+    'orderitem__menuitem__title',
+    'orderitem__quantity',
+    'orderitem__unit_price',
+    'orderitem__price',
+]
+
+
+class Echo:
+    """A file-like object that hands back what is written to it, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    rows = queryset.order_by('date', 'id').values_list(*_FIELDS)
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def merged_rows(querysets):
+    # Several order querysets (hot and archived orders) as one stream in date, id order.
+    if len(querysets) == 1:
+        return export_rows(querysets[0])
+    return heapq.merge(*(export_rows(queryset) for queryset in querysets), key=lambda row: (row[1], row[0]))
+
+
+def stream_csv(*querysets):
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_COLUMNS + ITEM_COLUMNS)
+    for row in merged_rows(querysets):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(*querysets):
+    order_width = len(ORDER_COLUMNS)
+    for order, rows in groupby(merged_rows(querysets), key=lambda row: row[:order_width]):
+        data = dict(zip(ORDER_COLUMNS, order))
+        data['date'] = data['date'].isoformat()
+        data['total'] = str(data['total'])
+        data['items'] = [
+            {
+                'menuitem': menuitem_id,
+                'menuitem_title': title,
+                'quantity': quantity,
+                'unit_price': str(unit_price),
+                'price': str(price),
+            }
+            for menuitem_id, title, quantity, unit_price, price in (row[order_width:] for row in rows)
+            if menuitem_id is not None
+        ]
+        yield json.dumps(data) + '\n'
+
+
+def filter_orders(date_from=None, date_to=None, status=None, delivery_crew=None, archived=False):
+    queryset = (ArchivedOrder if archived else Order).objects.all()
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    if delivery_crew is not None:
+        queryset = queryset.filter(delivery_crew=delivery_crew)
+    return queryset
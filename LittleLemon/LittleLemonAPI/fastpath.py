@@ -0,0 +1,101 @@
+"""Read-only serializers that build list responses straight from ``.values()`` rows.
+
+A ``ModelSerializer`` instantiates a model per row and then a field object
+walks each attribute; for a page of menu items or a cart that is most of the
+request's CPU. The classes here select only the columns a response needs and
+map each row dict to the output dict directly. Each one produces exactly what
+its ``serializers`` counterpart does (``FastSerializerContractTests`` holds
+them to that), so they are only for output: writes and validation still go
+through the DRF serializers.
+"""
+from decimal import Decimal
+
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+CENTS = Decimal('0.01')
+
+
+def money(value):
+    # serializers.DecimalField(decimal_places=2).to_representation()
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).strip())
+    value = value.quantize(CENTS)
+    return '{:f}'.format(value) if api_settings.COERCE_DECIMAL_TO_STRING else value
+
+
+class ValuesSerializer:
+    """Subclasses list the ``values()`` columns they read and map one row."""
+
+    columns = ()
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.columns)
+
+    @classmethod
+    def many(cls, rows):
+        represent = cls.represent
+        return [represent(row) for row in rows]
+
+
+class MenuItemValues(ValuesSerializer):
+    """``MenuItemSerializer`` output."""
+
+    columns = ('id', 'title', 'price', 'featured', 'category_id', 'category__slug', 'category__title')
+
+    @staticmethod
+    def represent(row):
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'price': money(row['price']),
+            'featured': row['featured'],
+            'category': {'id': row['category_id'], 'slug': row['category__slug'], 'title': row['category__title']},
+        }
+
+
+class CartValues(ValuesSerializer):
+    """``CartSerializer`` output; unit_price is the menu item's current price, as a Decimal."""
+
+    columns = ('menuitem_id', 'menuitem__title', 'quantity', 'menuitem__price', 'price')
+
+    @staticmethod
+    def represent(row):
+        return {
+            'menuitem': row['menuitem_id'],
+            'menuitem_title': row['menuitem__title'],
+            'quantity': row['quantity'],
+            'unit_price': row['menuitem__price'],
+            'price': money(row['price']),
+        }
+
+
+class OrderItemValues(ValuesSerializer):
+    """``OrderItemSerializer`` output."""
+
+    columns = ('order_id', 'menuitem__title', 'menuitem_id', 'quantity', 'unit_price', 'price')
+
+    @staticmethod
+    def represent(row):
+        return {
+            'order': row['order_id'],
+            'menuitem_title': row['menuitem__title'],
+            'menuitem': row['menuitem_id'],
+            'quantity': row['quantity'],
+            'unit_price': money(row['unit_price']),
+            'price': money(row['price']),
+        }
+
+
+class FastListMixin:
+    """List GETs through ``fast_serializer``; everything else keeps ``serializer_class``."""
+
+    fast_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.fast_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.fast_serializer.many(page))
+        return Response(self.fast_serializer.many(queryset))
@@ -0,0 +1,134 @@
+"""Replay-safe writes for requests sent with an ``Idempotency-Key`` header.
+
+A client that retries a POST after a dropped connection cannot tell whether
+the first attempt went through; without a key the retry checks out a second
+order. With one, the first request claims ``(user, key)`` by inserting an
+``IdempotencyKey`` row in the same transaction as the write itself and stores
+its response there before committing. A retry then finds the row and gets
+the stored response back (with ``Idempotent-Replayed: true``) instead of
+running the view again.
+
+The claim and the write commit or roll back together, so a request that
+fails (an exception, a 4xx or 5xx) leaves no trace and can be retried with
+the same key. A duplicate that arrives while the first is still running
+waits on the unique index until the first commits and then replays it; no
+lock outlives the request's own transaction. Reusing a key for a different
+request body is refused with 422.
+
+Stored responses expire after ``IDEMPOTENCY_KEY_TTL`` seconds; expired rows
+are reused on conflict and deleted every ``IDEMPOTENCY_PRUNE_EVERY`` claims.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_PRUNE_EVERY = getattr(settings, 'IDEMPOTENCY_PRUNE_EVERY', 1000)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+_claims = 0
+
+
+class _Discard(Exception):
+    # Rolls the claim back along with the write when the view did not succeed.
+
+    def __init__(self, response):
+        self.response = response
+
+
+def fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def rendered(data):
+    # What the client saw: the JSON the renderer produced, not the Python objects.
+    if data is None:
+        return None
+    return json.loads(JSONRenderer().render(data))
+
+
+def prune():
+    """Delete expired keys; returns the number deleted."""
+    return IdempotencyKey.objects.filter(expires__lte=timezone.now()).delete()[0]
+
+
+def claim(user, key, digest):
+    # Insert the key, or return the row that already holds it. The caller's
+    # transaction keeps a fresh claim invisible until it commits.
+    global _claims
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=digest,
+                    expires=timezone.now() + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                )
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if existing is not None and existing.expires > timezone.now():
+                return existing, False
+            IdempotencyKey.objects.filter(user=user, key=key, expires__lte=timezone.now()).delete()
+            continue
+        _claims += 1
+        if _claims % IDEMPOTENCY_PRUNE_EVERY == 0:
+            transaction.on_commit(prune)
+        return record, True
+    return existing, False
+
+
+def replay(record, digest):
+    if record is None:
+        # Claimed by a request that has not committed yet (or lost a race with pruning).
+        return Response({"error": "A request with this Idempotency-Key is still in progress."},
+                        status=status.HTTP_409_CONFLICT)
+    if record.fingerprint != digest:
+        return Response({"error": "This Idempotency-Key was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(handler):
+    """Decorate a view method so that requests with an ``Idempotency-Key`` run at most once."""
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        digest = fingerprint(request)
+        try:
+            with transaction.atomic():
+                record, created = claim(request.user, key, digest)
+                if not created:
+                    return replay(record, digest)
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code >= 400:
+                    raise _Discard(response)
+                record.status_code = response.status_code
+                record.response = rendered(response.data)
+                record.save(update_fields=['status_code', 'response'])
+                return response
+        except _Discard as discard:
+            return discard.response
+
+    return wrapper
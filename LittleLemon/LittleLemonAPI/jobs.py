@@ -0,0 +1,218 @@
+"""A small job queue backed by the ``Job`` table.
+
+``enqueue()`` inserts the job in the caller's transaction, so it becomes
+visible to workers exactly when that transaction commits and disappears
+with it on rollback; an ``on_commit`` hook then wakes any worker pool
+running in the same process. ``WorkerPool`` (started by the ``run_jobs``
+command) claims due jobs with a conditional UPDATE, so several pools and
+processes can share the table without a broker. A failing job is retried
+with exponential backoff and is marked dead after ``max_attempts``; dead
+jobs are listed and requeued through ``/api/jobs/dead/``. Jobs left running
+by a worker that died are released by the pools' periodic
+``release_stale()``, which counts the lost run as an attempt.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import reports
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOBS_MAX_ATTEMPTS = getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+JOBS_BACKOFF_BASE = getattr(settings, 'JOBS_BACKOFF_BASE', 2.0)
+JOBS_BACKOFF_MAX = getattr(settings, 'JOBS_BACKOFF_MAX', 3600.0)
+JOBS_LOCK_TIMEOUT = getattr(settings, 'JOBS_LOCK_TIMEOUT', 300)
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+handlers = {}
+_wakeup = threading.Condition()
+
+
+def handler(name):
+    """Register the decorated function as the handler of jobs called ``name``."""
+    def register(function):
+        handlers[name] = function
+        return function
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    if name not in handlers:
+        raise ValueError(f"No handler registered for job {name!r}.")
+    job = Job.objects.create(
+        name=name, payload=payload, run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or JOBS_MAX_ATTEMPTS,
+    )
+    transaction.on_commit(wake)
+    return job
+
+
+def enqueue_many(name, payloads, max_attempts=None):
+    """``enqueue()`` each payload in ``payloads`` with a single INSERT."""
+    if name not in handlers:
+        raise ValueError(f"No handler registered for job {name!r}.")
+    now = timezone.now()
+    jobs = Job.objects.bulk_create(
+        Job(name=name, payload=payload, run_at=now, max_attempts=max_attempts or JOBS_MAX_ATTEMPTS)
+        for payload in payloads
+    )
+    if jobs:
+        transaction.on_commit(wake)
+    return jobs
+
+
+def wake():
+    with _wakeup:
+        _wakeup.notify_all()
+
+
+def backoff(attempts):
+    # Exponential with full jitter, so retries of a batch of jobs that failed
+    # together (e.g. a provider outage) do not all come back at once.
+    return random.uniform(0, min(JOBS_BACKOFF_MAX, JOBS_BACKOFF_BASE ** attempts))
+
+
+def requeue(job_ids):
+    """Give dead jobs a fresh set of attempts; returns how many were requeued."""
+    return Job.objects.filter(pk__in=job_ids, status=Job.DEAD).update(
+        status=Job.PENDING, attempts=0, run_at=timezone.now(), locked_at=None, locked_by='', finished=None)
+
+
+def release_stale():
+    """Return jobs whose worker died mid-run to the queue; returns how many were released.
+
+    The lost run counts as an attempt (claim() already added it), so a job
+    that keeps killing its worker ends in the dead letters like one that
+    keeps raising.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=JOBS_LOCK_TIMEOUT))
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.DEAD, finished=now, locked_at=None, locked_by='',
+        last_error=f'The worker running the job did not finish it within {JOBS_LOCK_TIMEOUT} seconds.')
+    if dead:
+        logger.error("%d abandoned jobs had no attempts left; moved to the dead letters.", dead)
+    return dead + stale.update(status=Job.PENDING, run_at=now, locked_at=None, locked_by='')
+
+
+def claim(worker_id, limit=1):
+    """Claim up to ``limit`` due jobs for ``worker_id`` and return them."""
+    claimed = []
+    due = (Job.objects.filter(status=Job.PENDING, run_at__lte=timezone.now())
+           .order_by('run_at', 'id').values_list('pk', flat=True)[:limit * 4])
+    for pk in due:
+        # Whoever flips the status first owns the job; losers skip to the next id.
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(
+                status=Job.RUNNING, locked_at=timezone.now(), locked_by=worker_id, attempts=F('attempts') + 1):
+            claimed.append(Job.objects.get(pk=pk))
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def run(job):
+    # The handler's writes and the job's completion commit together, so a
+    # handler that only touches the database runs exactly once.
+    try:
+        with transaction.atomic():
+            handlers[job.name](**job.payload)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.DONE, finished=timezone.now(), locked_at=None, locked_by='')
+    except Exception:
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed %d times; moved to the dead letters.", job.pk, job.name, job.attempts)
+            job.status, job.finished = Job.DEAD, timezone.now()
+        else:
+            job.status, job.run_at = Job.PENDING, timezone.now() + timedelta(seconds=backoff(job.attempts))
+        job.locked_at, job.locked_by = None, ''
+        job.save(update_fields=['status', 'run_at', 'finished', 'locked_at', 'locked_by', 'last_error'])
+        return False
+    return True
+
+
+def run_pending(worker_id='inline', limit=None):
+    """Run due jobs on the calling thread until none are left; returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        jobs = claim(worker_id)
+        if not jobs:
+            break
+        run(jobs[0])
+        count += 1
+    return count
+
+
+class WorkerPool:
+    """Threads that poll the job table, each with its own database connection."""
+
+    def __init__(self, workers=2, poll_interval=1.0):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.threads = []
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.release_lock = threading.Lock()
+        self.released_at = None
+
+    def release_stale(self):
+        # Workers of other pools and processes may die at any time, so one
+        # thread of each pool looks for their jobs every JOBS_LOCK_TIMEOUT.
+        with self.release_lock:
+            now = time.monotonic()
+            if self.released_at is not None and now - self.released_at < JOBS_LOCK_TIMEOUT:
+                return 0
+            self.released_at = now
+        return release_stale()
+
+    def start(self):
+        self.release_stale()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.work, args=(f'{self.name}:{index}',), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        wake()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def work(self, worker_id):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                self.release_stale()
+                if run_pending(worker_id, limit=100):
+                    continue
+                with _wakeup:
+                    _wakeup.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+
+@handler(ORDER_CREATED)
+def order_created(order_id):
+    # Receipts, kitchen tickets and analytics hook in here.
+    logger.info("Order %s created.", order_id)
+    reports.record_order(order_id)
+
+
+@handler(ORDER_STATUS_CHANGED)
+def order_status_changed(order_id, status, delivery_crew, previous_status, previous_crew):
+    logger.info("Order %s status changed from %s to %s.", order_id, previous_status, status)
+    reports.record_status(order_id, [delivery_crew, previous_crew])
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from LittleLemonAPI.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Move delivered orders older than --days days, with their items, to the archive tables, "
+        "one transaction per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must not be negative.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        before = timezone.localdate() - timedelta(days=options['days'])
+        progress = lambda moved: self.stdout.write(f"Archived {moved} orders so far.")
+        moved = archive_orders(before, options['batch_size'], progress)
+        self.stdout.write(f"Archived {moved} orders dated before {before}.")
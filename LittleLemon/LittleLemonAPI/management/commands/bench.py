@@ -0,0 +1,80 @@
+import json
+import logging
+import warnings
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.views import APIView
+
+from LittleLemonAPI import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the benchmark scenarios and report latency percentiles, queries per request and throughput. "
+        "Without --url, a throwaway test database is created, seeded and driven through the Django test "
+        "client. With --url, requests go to a running server that shares this project's database; seed it "
+        "first with seed_data and start it with DISABLE_THROTTLING=1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--scenario', action='append', choices=sorted(bench.SCENARIOS),
+                            help="Scenario to run; repeat for several. Defaults to all of them.")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=1, help="Worker threads (--url only).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--orders', type=int, default=2000, help="Orders to seed in the throwaway database.")
+        parser.add_argument('--json', dest='json_path', help="Write the results as JSON to this file, or - for stdout.")
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(bench.SCENARIOS)
+        # Expected 4xx answers and pagination warnings would drown the report.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        warnings.simplefilter('ignore')
+        if options['url']:
+            results = bench.run(bench.HTTPClient(options['url']), scenarios, options['iterations'],
+                                concurrency=options['concurrency'], seed_value=options['seed'])
+        else:
+            if options['concurrency'] > 1:
+                raise CommandError("--concurrency needs --url; the test client runs in a single thread.")
+            results = self.run_in_process(scenarios, options)
+
+        results['mode'] = options['url'] or 'in-process'
+        results['scenarios'] = scenarios
+        results['iterations'] = options['iterations']
+
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+        self.print_table(results)
+
+    def run_in_process(self, scenarios, options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            bench.seed(orders=options['orders'], seed_value=options['seed'])
+            # Throttling would cap the run at a handful of requests a minute.
+            with mock.patch.object(APIView, 'get_throttles', lambda view: []):
+                return bench.run(bench.InProcessClient(), scenarios, options['iterations'],
+                                 seed_value=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def print_table(self, results):
+        self.stdout.write(f"{'endpoint':<34} {'reqs':>6} {'4xx':>5} {'5xx':>5} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+        for name, row in results['endpoints'].items():
+            queries = '-' if row['queries_per_request'] is None else f"{row['queries_per_request']:.1f}"
+            self.stdout.write(
+                f"{name:<34} {row['requests']:>6} {row['client_errors']:>5} {row['server_errors']:>5} "
+                f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {queries:>8}"
+            )
+        self.stdout.write(f"{results['requests']} requests in {results['wall_time_s']:.2f}s "
+                          f"({results['throughput_rps']:.1f} req/s)")
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, OperationalError
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+
+from LittleLemonAPI.checkout import checkout
+from LittleLemonAPI.models import Category, MenuItem, Cart, Order
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Report query count and latency of checkout for increasing cart sizes; all data is rolled back. "
+        "With --writers, run that many threads checking out concurrently against the configured database "
+        "and report throughput, so each DB_* mode from settings.py can be compared. Those checkouts are "
+        "committed, so with SQLite point DB_NAME at a throwaway, migrated database, e.g. "
+        "DB_NAME=/tmp/bench.sqlite3 manage.py migrate && DB_NAME=/tmp/bench.sqlite3 manage.py bench_checkout --writers 8."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 30, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--writers', type=int, help="Concurrent checkout threads.")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds to run with --writers.")
+
+    def handle(self, *args, **options):
+        if options['writers']:
+            self.concurrent(options['writers'], options['duration'], max(options['sizes'][0], 1))
+        else:
+            self.by_cart_size(options['sizes'], options['repeat'])
+
+    def create_menu(self, count):
+        category = Category.objects.create(slug='bench', title='Bench')
+        items = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Bench {i}', price=Decimal('1.00'), featured=False, category=category)
+            for i in range(count)
+        )
+        return category, items
+
+    def fill_cart(self, user, items):
+        Cart.objects.bulk_create(
+            Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in items
+        )
+
+    def by_cart_size(self, sizes, repeat):
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username='bench-checkout')
+                _, items = self.create_menu(max(sizes))
+
+                self.stdout.write(f"{'lines':>6} {'queries':>8} {'ms (best)':>10} {'ms (mean)':>10}")
+                for size in sizes:
+                    timings = []
+                    try:
+                        for _ in range(repeat):
+                            self.fill_cart(user, items[:size])
+                            with CaptureQueriesContext(connection) as captured:
+                                started = time.perf_counter()
+                                checkout(user)
+                                timings.append((time.perf_counter() - started) * 1000)
+                    except ValidationError as error:
+                        Cart.objects.filter(user=user).delete()
+                        self.stdout.write(f"{size:>6} checkout refused: {error.detail['error']}")
+                        continue
+                    self.stdout.write(
+                        f"{size:>6} {len(captured.captured_queries):>8} "
+                        f"{min(timings):>10.2f} {sum(timings) / len(timings):>10.2f}"
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def concurrent(self, writers, duration, size):
+        database = settings.DATABASES['default']
+        if database['ENGINE'].endswith('sqlite3') and 'DB_NAME' not in os.environ:
+            raise CommandError("--writers commits to the database; set DB_NAME to a throwaway SQLite file "
+                               "(e.g. DB_NAME=/tmp/bench.sqlite3) rather than writing into the dev database.")
+        self.stdout.write(
+            f"{database['ENGINE']} {database['NAME']} options={database.get('OPTIONS', {})} "
+            f"pragmas={getattr(settings, 'SQLITE_PRAGMAS', None)}"
+        )
+        users = [User.objects.create(username=f'bench-writer-{i}') for i in range(writers)]
+        category, items = self.create_menu(size)
+        timings = []
+        failures = []
+        deadline = time.perf_counter() + duration
+
+        def write(user):
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        self.fill_cart(user, items)
+                        checkout(user)
+                    except (OperationalError, ValidationError) as error:
+                        failures.append(str(error))
+                        Cart.objects.filter(user=user).delete()
+                    else:
+                        timings.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        Order.objects.filter(user__in=users).delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        MenuItem.objects.filter(category=category).delete()
+        category.delete()
+
+        timings.sort()
+        self.stdout.write(f"{writers} writers, {size} lines per cart, {elapsed:.1f}s")
+        self.stdout.write(f"  checkouts:  {len(timings)} ({len(timings) / elapsed:.1f}/s)")
+        if timings:
+            self.stdout.write(f"  p50 / p95:  {timings[len(timings) // 2] * 1000:.1f}ms / "
+                              f"{timings[int(len(timings) * 0.95)] * 1000:.1f}ms")
+        self.stdout.write(f"  failures:   {len(failures)}" + (f" (e.g. {failures[0]})" if failures else ''))
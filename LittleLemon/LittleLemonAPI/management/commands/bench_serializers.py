@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from LittleLemonAPI.fastpath import CartValues, MenuItemValues, OrderItemValues
+from LittleLemonAPI.models import Category, MenuItem, Cart, Order, OrderItem
+from LittleLemonAPI.serializers import CartSerializer, MenuItemSerializer, OrderItemSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU cost per row of the DRF list serializers with the values() fast path "
+        "(LittleLemonAPI/fastpath.py). Rows are fetched once up front, so only serialization is "
+        "timed; all data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.compare(options['rows'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def compare(self, rows, repeat):
+        user = User.objects.create(username='bench-serializers')
+        category = Category.objects.create(slug='bench', title='Bench')
+        items = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Bench {i}', price=Decimal('1.25') + i, featured=i % 3 == 0, category=category)
+            for i in range(rows)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2) for item in items)
+        order = Order.objects.create(user=user, total=0)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in items
+        )
+
+        cases = [
+            ('menu items', MenuItemSerializer, MenuItemValues,
+             MenuItem.objects.filter(category=category).select_related('category')),
+            ('cart', CartSerializer, CartValues, Cart.objects.filter(user=user).select_related('menuitem')),
+            ('order items', OrderItemSerializer, OrderItemValues,
+             OrderItem.objects.filter(order=order).select_related('menuitem')),
+        ]
+        self.stdout.write(f"{rows} rows, best of {repeat}")
+        self.stdout.write(f"{'':<12} {'DRF us/row':>11} {'fast us/row':>12} {'speedup':>8}")
+        for name, serializer_class, fast, queryset in cases:
+            instances = list(queryset)
+            values = list(fast.values(queryset))
+            slow_time = self.best(lambda: serializer_class(instances, many=True).data, repeat)
+            fast_time = self.best(lambda: fast.many(values), repeat)
+            self.stdout.write(f"{name:<12} {slow_time / rows * 1e6:>11.2f} {fast_time / rows * 1e6:>12.2f} "
+                              f"{slow_time / fast_time:>7.1f}x")
+
+    def best(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from LittleLemonAPI import views
+from LittleLemonAPI.models import Order
+from LittleLemonAPI.pagination import KeysetPagination
+from LittleLemonAPI.roles import MANAGER, DELIVERY_CREW
+
+ENDPOINTS = [
+    ('/api/menu-items/', views.MenuItemsView),
+    ('/api/category/', views.MenuCategoryView),
+    ('/api/cart/menu-items/', views.CartView),
+    ('/api/orders/', views.OrderView),
+    ('/api/orders/<order_id>', views.OrderItemView),
+]
+
+
+class Command(BaseCommand):
+    help = "Print the EXPLAIN plan of every list endpoint's queryset, once per role."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', help="Only explain endpoints whose path contains this string.")
+
+    def handle(self, *args, **options):
+        users = {
+            'manager': User.objects.filter(groups__name=MANAGER).first(),
+            'delivery crew': User.objects.filter(groups__name=DELIVERY_CREW).first(),
+            'customer': User.objects.filter(groups__isnull=True, is_superuser=False).first(),
+        }
+        order = Order.objects.order_by('-id').first()
+        factory = APIRequestFactory()
+
+        for path, view_class in ENDPOINTS:
+            if options['endpoint'] and options['endpoint'] not in path:
+                continue
+            kwargs = {}
+            if '<order_id>' in path:
+                if order is None:
+                    self.stdout.write(f"-- {path}: skipped, there are no orders")
+                    continue
+                kwargs['order_id'] = order.pk
+
+            for role, user in users.items():
+                if user is None:
+                    self.stdout.write(f"-- {path} as {role}: skipped, no such user")
+                    continue
+                queryset = self.get_queryset(factory, view_class, user, kwargs)
+                if queryset is None:
+                    self.stdout.write(f"-- {path} as {role}: no queryset")
+                    continue
+                self.stdout.write(self.style.MIGRATE_HEADING(f"-- {path} as {role} ({user.username})"))
+                self.stdout.write(str(queryset.query))
+                self.stdout.write(queryset.explain())
+                self.stdout.write('')
+
+    def get_queryset(self, factory, view_class, user, kwargs):
+        view = view_class()
+        view.request = view.initialize_request(factory.get('/'))
+        view.request.user = user
+        view.kwargs = kwargs
+        view.format_kwarg = None
+
+        queryset = view.get_queryset()
+        if queryset is None:
+            return None
+        queryset = view.filter_queryset(queryset)
+        paginator = view.paginator
+        if isinstance(paginator, KeysetPagination):
+            queryset = queryset.order_by(*paginator.ordering)[:paginator.page_size + 1]
+        elif paginator is not None:
+            queryset = queryset[:paginator.page_size]
+        return queryset
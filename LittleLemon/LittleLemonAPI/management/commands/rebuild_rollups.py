@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from LittleLemonAPI.reports import REBUILD_CHUNK_DAYS, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales, menu item and delivery crew rollups from the orders, "
+        "one transaction per chunk of days. Defaults to every day with orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to rebuild, YYYY-MM-DD.")
+        parser.add_argument('--until', help="Last day to rebuild, YYYY-MM-DD.")
+        parser.add_argument('--chunk-days', type=int, default=REBUILD_CHUNK_DAYS)
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f"--{name} must be a date in YYYY-MM-DD format.")
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1.")
+
+        progress = lambda start, stop: self.stdout.write(f"Rebuilt {start} to {stop}.")
+        days = rebuild(dates.get('since'), dates.get('until'), options['chunk_days'], progress)
+        self.stdout.write(f"Rebuilt {days} days.")
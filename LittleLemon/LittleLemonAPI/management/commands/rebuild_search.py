@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.catalogue import bump_version
+from LittleLemonAPI.search import rebuild, supported
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text menu search index from the menu items and categories."
+
+    def handle(self, *args, **options):
+        if not supported():
+            self.stdout.write("This database backend has no search index; search uses LIKE queries.")
+            return
+        count = rebuild()
+        # Cached menu responses may hold results from the old index.
+        bump_version()
+        self.stdout.write(f"Indexed {count} menu items.")
@@ -0,0 +1,38 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.jobs import WorkerPool, release_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the Job table with a pool of worker threads until interrupted. "
+        "With --drain, run every due job on this thread and exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for new jobs.")
+        parser.add_argument('--drain', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['drain']:
+            release_stale()
+            self.stdout.write(f"Ran {run_pending()} jobs.")
+            return
+
+        pool = WorkerPool(options['workers'], options['poll_interval'])
+        stop = lambda *args: pool.stopping.set()
+        signal.signal(signal.SIGTERM, stop)
+        pool.start()
+        self.stdout.write(f"Running {options['workers']} workers as {pool.name}; Ctrl-C to stop.")
+        try:
+            while not pool.stopping.is_set():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Stopping; waiting for running jobs to finish.")
+        pool.stop()
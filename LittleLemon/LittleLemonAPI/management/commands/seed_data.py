@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.bench import seed
+
+
+class Command(BaseCommand):
+    help = "Seed benchmark users, categories, menu items, carts and orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--crew', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=5)
+        parser.add_argument('--items', type=int, default=100)
+        parser.add_argument('--carts', type=int, default=20, help="How many users start with a filled cart.")
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable data.")
+
+    def handle(self, *args, **options):
+        created = seed(
+            users=options['users'], crew=options['crew'], categories=options['categories'],
+            items=options['items'], carts=options['carts'], orders=options['orders'],
+            seed_value=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name.replace("_", " ")}' for name, count in created.items())))
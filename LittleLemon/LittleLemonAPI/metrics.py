@@ -0,0 +1,253 @@
+"""Per-route request metrics, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and counts the database queries it
+runs through an execute wrapper, which is cheap enough to leave on in
+production. The wrapper is installed on every connection as it is opened
+and reports to the timer of the current request, held in a context
+variable: under ASGI the ORM runs in ``sync_to_async`` worker threads with
+their own connections, and the context variable follows the request there.
+Aggregates live in process memory, so each worker serves its own numbers on
+``/metrics`` and Prometheus sums them across scrapes.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.functional import SimpleLazyObject
+
+from .roles import aget_roles, get_roles, MANAGER, DELIVERY_CREW
+
+logger = logging.getLogger('LittleLemonAPI.slow')
+
+METRICS_BUCKETS = getattr(settings, 'METRICS_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+METRICS_SLOW_REQUEST_MS = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds=METRICS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class RouteStats:
+    __slots__ = ('duration', 'db_time', 'render_time', 'queries', 'statuses')
+
+    def __init__(self):
+        self.duration = Histogram()
+        self.db_time = Histogram()
+        self.render_time = Histogram()
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, labels, status, duration, db_time, render_time, queries):
+        with self.lock:
+            stats = self.routes.get(labels)
+            if stats is None:
+                stats = self.routes[labels] = RouteStats()
+            stats.duration.observe(duration)
+            stats.db_time.observe(db_time)
+            stats.render_time.observe(render_time)
+            stats.queries.observe(queries)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            routes = sorted(self.routes.items())
+            for metric, attribute, help_text in (
+                ('littlelemon_request_duration_seconds', 'duration', 'Wall time of the request.'),
+                ('littlelemon_db_duration_seconds', 'db_time', 'Time spent in database queries.'),
+                ('littlelemon_render_duration_seconds', 'render_time', 'Time spent rendering the response body.'),
+                ('littlelemon_db_queries', 'queries', 'Database queries run by the request.'),
+            ):
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for labels, stats in routes:
+                    lines.extend(_histogram_lines(metric, _labels(labels), getattr(stats, attribute)))
+
+            lines.append('# HELP littlelemon_requests_total Requests by response status.')
+            lines.append('# TYPE littlelemon_requests_total counter')
+            for labels, stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'littlelemon_requests_total{{{_labels(labels)},status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    route, view, method, role = labels
+    return f'route="{route}",view="{view}",method="{method}",role="{role}"'
+
+
+def _histogram_lines(metric, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        yield f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}'
+    yield f'{metric}_sum{{{labels}}} {histogram.total}'
+    yield f'{metric}_count{{{labels}}} {histogram.count}'
+
+
+registry = Registry()
+
+
+def role_label(user):
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    roles = get_roles(user)
+    if MANAGER in roles:
+        return 'manager'
+    if DELIVERY_CREW in roles:
+        return 'delivery_crew'
+    return 'customer'
+
+
+class QueryTimer:
+    """``execute_wrapper`` callable that counts and times queries."""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.time = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.time += elapsed
+            if self.keep_sql:
+                self.queries.append((elapsed, sql))
+
+
+_timer = ContextVar('littlelemon_query_timer', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    timer = _timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    # connection_created receiver (see apps.py); without a connection, wraps
+    # the ones this thread already has open.
+    for connection in [connection] if connection is not None else connections.all(initialized_only=True):
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, started = self.start(request)
+        token = _timer.set(timer)
+        try:
+            response = self.get_response(request)
+            # Resolve the roles role_label() needs while their queries still
+            # count towards this request.
+            user = getattr(request, 'user', None)
+            get_roles(user)
+        finally:
+            _timer.reset(token)
+        return self.finish(request, response, timer, started, user)
+
+    async def __acall__(self, request):
+        timer, started = self.start(request)
+        token = _timer.set(timer)
+        try:
+            response = await self.get_response(request)
+            # role_label() may not touch the database from the event loop;
+            # resolve the (possibly lazy) user and its roles here instead.
+            user = getattr(request, 'user', None)
+            if isinstance(user, SimpleLazyObject):
+                if hasattr(request, 'auser'):
+                    user = await request.auser()
+                else:  # Django < 5.0: evaluate it off the event loop
+                    await sync_to_async(getattr)(user, 'is_authenticated')
+            await aget_roles(user)
+        finally:
+            _timer.reset(token)
+        return self.finish(request, response, timer, started, user)
+
+    def start(self, request):
+        request._metrics_render_time = 0.0
+        return QueryTimer(keep_sql=METRICS_SLOW_REQUEST_MS is not None), time.perf_counter()
+
+    def finish(self, request, response, timer, started, user):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        if match is not None:
+            labels = (match.route, match.view_name, request.method, role_label(user))
+        else:
+            labels = ('<unmatched>', '', request.method, 'anonymous')
+        registry.record(labels, response.status_code, duration, timer.time, request._metrics_render_time, timer.count)
+
+        if METRICS_SLOW_REQUEST_MS is not None and duration * 1000 >= METRICS_SLOW_REQUEST_MS:
+            slowest = sorted(timer.queries, reverse=True)[:5]
+            logger.warning(
+                "Slow request %s %s (%s) took %.1fms with %d queries (%.1fms in the database)%s",
+                request.method, request.path, labels[0], duration * 1000, timer.count, timer.time * 1000,
+                ''.join(f'\n  {elapsed * 1000:.1f}ms {sql}' for elapsed, sql in slowest),
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook; time the render.
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0011_menu_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('period', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('previous', models.PositiveIntegerField(default=0)),
+                ('expires', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+    ]
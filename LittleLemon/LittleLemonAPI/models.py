@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 # Create your models here.
@@ -35,6 +36,24 @@ class Order(models.Model):
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, auto_now_add=True)
+    # Denormalised at checkout so listings never need to touch OrderItem.
+    item_count = models.PositiveIntegerField(default=0)
+    menuitem_count = models.PositiveIntegerField(default=0)
+    # Bumped on every update; sent as the ETag of /api/orders/<id>.
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination walks (date, id) newest first: every order for
+            # managers, assigned orders for delivery crew, own orders for customers.
+            models.Index(fields=['-date', '-id'], name='order_date_id_idx'),
+            models.Index(fields=['-date', '-id'], name='order_assigned_date_idx',
+                         condition=models.Q(delivery_crew__isnull=False)),
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', '-date', '-id'], name='order_crew_date_idx',
+                         condition=models.Q(delivery_crew__isnull=False)),
+            models.Index(fields=['status', 'date'], name='order_status_date_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -47,3 +66,108 @@ class OrderItem(models.Model):
         unique_together = ('order', 'menuitem')
 
 
+
+class Job(models.Model):
+    """A unit of background work, run by the ``run_jobs`` command (see jobs.py)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (DEAD, 'Dead')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for due pending jobs; the dead-letter view lists dead ones.
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+# Rollups kept by reports.py; the report endpoints read only these.
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    delivered = models.PositiveIntegerField(default=0)
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+class DailyCrewDeliveries(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    delivered = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
+
+# One row per client and throttle scope; see throttling.DatabaseStore.
+class ThrottleCounter(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    period = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    previous = models.PositiveIntegerField(default=0)
+    expires = models.BigIntegerField(db_index=True)
+
+# The stored response of a request sent with an Idempotency-Key; see idempotency.py.
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+# Completed orders moved out of Order and OrderItem by archive.py, with their
+# ids. The related names match Order's, so the order serializers and
+# filters work on either.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField()
+    item_count = models.PositiveIntegerField(default=0)
+    menuitem_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='archived_order_date_id_idx'),
+            models.Index(fields=['user', '-date', '-id'], name='archived_order_user_date_idx'),
+            models.Index(fields=['delivery_crew', '-date', '-id'], name='archived_order_crew_date_idx'),
+        ]
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE,
+                              related_name='orderitem_set', related_query_name='orderitem')
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        unique_together = ('order', 'menuitem')
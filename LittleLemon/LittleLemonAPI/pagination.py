@@ -0,0 +1,191 @@
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from django.core.paginator import InvalidPage
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a compound key, e.g. ``(date, id)``.
+
+    Each page is fetched with ``WHERE (date, id) < (last_date, last_id)``
+    instead of an OFFSET, so page 1000 costs the same as page 1. All ordering
+    fields must sort in the same direction and together be unique.
+    """
+    ordering = ('-date', '-id')
+    page_size = getattr(settings, 'ORDERS_PAGE_SIZE', api_settings.PAGE_SIZE)
+    max_page_size = getattr(settings, 'ORDERS_MAX_PAGE_SIZE', 100)
+    include_count = getattr(settings, 'ORDERS_PAGINATION_COUNT', True)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = queryset.count() if self.get_include_count(request) else None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = await queryset.acount() if self.get_include_count(request) else None
+        return self.set_page([row async for row in page_queryset])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        # One page over several querysets with the same ordering fields and
+        # disjoint keys (e.g. hot and archived orders): each contributes at
+        # most a page's worth of rows, merged in key order.
+        pages = [list(self.get_page_queryset(queryset, request)) for queryset in querysets]
+        self.count = sum(queryset.count() for queryset in querysets) if self.get_include_count(request) else None
+        return self.set_page(self.merge(pages))
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        pages = [[row async for row in self.get_page_queryset(queryset, request)] for queryset in querysets]
+        if self.get_include_count(request):
+            self.count = sum([await queryset.acount() for queryset in querysets])
+        else:
+            self.count = None
+        return self.set_page(self.merge(pages))
+
+    def merge(self, pages):
+        # Pages come back in the order get_page_queryset() sorted them.
+        descending = self.ordering[0].startswith('-') != self.reverse
+        key = lambda row: tuple(getattr(row, field) for field in self.fields)
+        return list(islice(heapq.merge(*pages, key=key, reverse=descending), self.limit + 1))
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+        descending = self.ordering[0].startswith('-')
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+        if self.position is not None:
+            self.position = self.parse_position(queryset.model, self.position)
+            queryset = queryset.filter(self.seek(self.fields, self.position, after=descending == self.reverse))
+        if descending == self.reverse:
+            order_by = self.fields
+        else:
+            order_by = ['-' + field for field in self.fields]
+        return queryset.order_by(*order_by)[:self.limit + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = rows
+        return rows
+
+    def seek(self, fields, position, after):
+        # Lexicographic comparison: (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        lookup = 'gt' if after else 'lt'
+        condition = Q()
+        for index, field in enumerate(fields):
+            equal = {f: position[i] for i, f in enumerate(fields[:index])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[index]})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_include_count(self, request):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return self.include_count
+        return value.lower() not in ('0', 'false', 'no')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            position, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def parse_position(self, model, position):
+        # Cursors are encoded as strings; anything else, or a value the
+        # ordering field rejects, was not made by encode_cursor().
+        try:
+            if not all(isinstance(value, str) for value in position):
+                raise ValueError
+            return [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        position = [str(getattr(row, field)) for field in self.fields]
+        encoded = base64.urlsafe_b64encode(json.dumps([position, reverse]).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """``PageNumberPagination`` with an ``apaginate_queryset`` for the ASGI read views."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [row async for row in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
@@ -1,20 +1,14 @@
 from rest_framework import permissions
-from django.contrib.auth.models import Group
+from .roles import is_manager, is_delivery_crew
 
 class GroupPermission(permissions.BasePermission):
     
     def has_permission(self, request, view):
         
-        group_name = 'Manager'
         if request.method == 'GET':
             return True
         if request.user.is_authenticated:
-
-            try:
-                manager_group = Group.objects.get(name=group_name)
-                return manager_group in request.user.groups.all() or request.user.is_superuser
-            except Group.DoesNotExist:
-                return False
+            return is_manager(request.user) or request.user.is_superuser
             
         return False
 
@@ -22,7 +16,7 @@ class IsManagerOrFullAccess(permissions.BasePermission):
     def has_permission(self, request, view):
         #if request.method in permissions.SAFE_METHODS:
         #    return True
-        if request.user.groups.filter(name="Manager").exists():
+        if is_manager(request.user):
             return True
         return request.user.is_authenticated #False #request.method in ["GET", "POST", "HEAD", "OPTIONS"]
     
@@ -39,4 +33,4 @@ class IsDeliveryCrew(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         user = request.user
-        return user.groups.filter(name="Delivery crew").exists()
+        return is_delivery_crew(user)
@@ -0,0 +1,170 @@
+"""Server-sent events for order status and delivery crew changes.
+
+Writers call ``order_changed()``, which publishes after the transaction
+commits. The broker delivers each event to the open streams of the order's
+owner, its delivery crew and every manager. ``InProcessBroker`` fans out
+inside one process, which covers a single ASGI server handling both reads
+and writes; ``RedisBroker`` relays events between processes over Redis
+pub/sub and fans out locally in each of them. ``PUSH_BROKER`` picks one.
+
+Each open stream costs one ``Subscription`` (a bounded deque and an
+``asyncio.Event``) plus its suspended generator, so a worker can hold
+thousands of idle connections.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PUSH_BROKER = getattr(settings, 'PUSH_BROKER', 'LittleLemonAPI.push.InProcessBroker')
+PUSH_QUEUE_SIZE = getattr(settings, 'PUSH_QUEUE_SIZE', 32)
+PUSH_KEEPALIVE = getattr(settings, 'PUSH_KEEPALIVE', 15)
+
+
+class Subscription:
+    __slots__ = ('user_id', 'manager', 'loop', 'events', 'ready')
+
+    def __init__(self, user_id, manager):
+        self.user_id = user_id
+        self.manager = manager
+        self.loop = asyncio.get_running_loop()
+        # A slow reader loses its oldest events rather than growing without bound.
+        self.events = deque(maxlen=PUSH_QUEUE_SIZE)
+        self.ready = asyncio.Event()
+
+    def deliver(self, event):
+        # Called on the subscriber's event loop.
+        self.events.append(event)
+        self.ready.set()
+
+    async def next(self, timeout):
+        """Return the next event, or None if none arrived within ``timeout`` seconds."""
+        if not self.events:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.events.popleft()
+
+
+class InProcessBroker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_user = {}
+        self.managers = set()
+
+    def subscribe(self, user_id, manager=False):
+        subscription = Subscription(user_id, manager)
+        with self.lock:
+            self.by_user.setdefault(user_id, set()).add(subscription)
+            if manager:
+                self.managers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.by_user.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.by_user[subscription.user_id]
+            self.managers.discard(subscription)
+
+    def publish(self, event, audience):
+        """Deliver ``event`` to the streams of the user ids in ``audience`` and of managers."""
+        with self.lock:
+            recipients = set(self.managers)
+            for user_id in audience:
+                recipients.update(self.by_user.get(user_id, ()))
+        for subscription in recipients:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has closed; its stream is gone.
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(InProcessBroker):
+    """Relays events through a Redis channel to every process's local subscribers."""
+
+    channel = 'littlelemon:push'
+
+    def __init__(self, url=None):
+        import redis
+
+        super().__init__()
+        self.redis = redis.Redis.from_url(url or settings.PUSH_REDIS_URL)
+        self.listener = None
+
+    def subscribe(self, user_id, manager=False):
+        if self.listener is None:
+            with self.lock:
+                if self.listener is None:
+                    self.listener = threading.Thread(target=self.listen, daemon=True)
+                    self.listener.start()
+        return super().subscribe(user_id, manager)
+
+    def publish(self, event, audience):
+        self.redis.publish(self.channel, json.dumps({'event': event, 'audience': list(audience)}))
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                data = json.loads(message['data'])
+                super().publish(data['event'], data['audience'])
+            except Exception:
+                logger.exception("Could not relay a push message.")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(PUSH_BROKER)()
+    return _broker
+
+
+def order_changed(order):
+    """Publish ``order``'s status and delivery crew once the current transaction commits."""
+    order_changes([(order.pk, order.user_id, order.delivery_crew_id, order.status)])
+
+
+def order_changes(rows):
+    """Like ``order_changed()`` for many ``(id, user_id, delivery_crew_id, status)`` rows."""
+    def publish():
+        broker = get_broker()
+        for order_id, user_id, crew_id, status in rows:
+            event = {'order': order_id, 'status': status, 'delivery_crew': crew_id}
+            broker.publish(event, [user_id] if crew_id is None else [user_id, crew_id])
+
+    transaction.on_commit(publish)
+
+
+async def stream(broker, subscription, keepalive=PUSH_KEEPALIVE):
+    try:
+        yield f'retry: {keepalive * 1000}\n\n'
+        while True:
+            event = await subscription.next(keepalive)
+            if event is None:
+                # Comment lines keep proxies from closing an idle stream.
+                yield ': keepalive\n\n'
+            else:
+                yield f'event: order\ndata: {json.dumps(event)}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
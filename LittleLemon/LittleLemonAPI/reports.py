@@ -0,0 +1,167 @@
+"""Sales rollups and the manager reports read from them.
+
+The rollups hold one row per day, per day and menu item, and per day and
+delivery crew member, keyed on the order's date. The ``order.created`` and
+``order.status_changed`` jobs keep them current one order at a time (the
+latter recounts the day's deliveries rather than applying a delta);
+``rebuild()`` (the ``rebuild_rollups`` command) recomputes any date range
+from ``Order`` and ``OrderItem`` in chunks, e.g. after orders are deleted;
+archived orders (see archive.py) are included.
+Reports never touch the order tables, so their cost depends on the number
+of days asked for, not on the number of orders.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, DailyMenuItemSales, DailyCrewDeliveries
+
+REBUILD_CHUNK_DAYS = 31
+
+# (orders, items) of the hot and the archive tables.
+ORDER_TABLES = ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem))
+
+
+def _bump(model, keys, **deltas):
+    # UPDATE ... SET x = x + delta; insert the row on its first use.
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another writer inserted the row first.
+        model.objects.filter(**keys).update(**increments)
+
+
+def record_order(order_id):
+    # Deliveries are counted by record_status() alone, which recounts them
+    # from the orders, so it does not matter which of the two jobs runs first.
+    order = Order.objects.filter(pk=order_id).values('date', 'total', 'item_count').first()
+    if order is None:
+        return
+    _bump(DailySales, {'date': order['date']}, orders=1, items=order['item_count'], revenue=order['total'])
+    lines = OrderItem.objects.filter(order_id=order_id).values_list('menuitem_id', 'quantity', 'price')
+    for menuitem_id, quantity, price in lines:
+        _bump(DailyMenuItemSales, {'date': order['date'], 'menuitem_id': menuitem_id}, quantity=quantity, revenue=price)
+
+
+def _delivered(order_date, **filters):
+    return sum(order_model.objects.filter(date=order_date, status=True, **filters).count()
+               for order_model, _ in ORDER_TABLES)
+
+
+def record_status(order_id, crews=()):
+    """Recount the deliveries of the order's day, overall and for each of ``crews``.
+
+    Status jobs run on a pool and retries reorder them, so rather than apply
+    a delta that may arrive after a later one, each job recounts from the
+    orders as they stand (an indexed count of one day). ``crews`` are the
+    crew members the order was and is assigned to; None is skipped.
+    """
+    order_date = Order.objects.filter(pk=order_id).values_list('date', flat=True).first()
+    if order_date is None:
+        return
+    DailySales.objects.update_or_create(date=order_date, defaults={'delivered': _delivered(order_date)})
+    for crew_id in set(crews) - {None}:
+        delivered = _delivered(order_date, delivery_crew_id=crew_id)
+        keys = {'date': order_date, 'delivery_crew_id': crew_id}
+        if delivered:
+            DailyCrewDeliveries.objects.update_or_create(**keys, defaults={'delivered': delivered})
+        else:
+            # rebuild() keeps no rows for crew members without deliveries.
+            DailyCrewDeliveries.objects.filter(**keys).delete()
+
+
+def rebuild(date_from=None, date_to=None, chunk_days=REBUILD_CHUNK_DAYS, progress=None):
+    """Recompute the rollups for ``date_from``..``date_to`` (default: all orders).
+
+    Each chunk of ``chunk_days`` days is replaced in its own transaction, so
+    readers never see a half-built day and a long rebuild can be resumed.
+    """
+    bounds = [order_model.objects.aggregate(first=Min('date'), last=Max('date')) for order_model, _ in ORDER_TABLES]
+    firsts = [bound['first'] for bound in bounds if bound['first'] is not None]
+    if not firsts:
+        return 0
+    first, last = min(firsts), max(bound['last'] for bound in bounds if bound['last'] is not None)
+    start = max(date_from or first, first)
+    end = min(date_to or last, last)
+
+    days = 0
+    while start <= end:
+        stop = min(start + timedelta(days=chunk_days - 1), end)
+        _rebuild_chunk(start, stop)
+        days += (stop - start).days + 1
+        if progress is not None:
+            progress(start, stop)
+        start = stop + timedelta(days=1)
+    return days
+
+
+def _totals(querysets, keys):
+    # Sum the aggregate rows of several querysets that share the same ``keys``.
+    totals = {}
+    for queryset in querysets:
+        for row in queryset:
+            key = tuple(row.pop(name) for name in keys)
+            totals.setdefault(key, Counter()).update(row)
+    return totals
+
+
+def _rebuild_chunk(start, stop):
+    tables = [
+        (order_model.objects.filter(date__range=(start, stop)),
+         item_model.objects.filter(order__date__range=(start, stop)))
+        for order_model, item_model in ORDER_TABLES
+    ]
+    with transaction.atomic():
+        for model in (DailySales, DailyMenuItemSales, DailyCrewDeliveries):
+            model.objects.filter(date__range=(start, stop)).delete()
+
+        days = _totals([orders.values('date').annotate(
+            orders=Count('id'), items=Sum('item_count'), revenue=Sum('total'),
+            delivered=Count('id', filter=Q(status=True)),
+        ).order_by() for orders, _ in tables], ['date'])
+        DailySales.objects.bulk_create(DailySales(date=date, **row) for (date,), row in days.items())
+
+        menu = _totals([items.values('order__date', 'menuitem').annotate(
+            quantity=Sum('quantity'), revenue=Sum('price'),
+        ).order_by() for _, items in tables], ['order__date', 'menuitem'])
+        DailyMenuItemSales.objects.bulk_create(
+            DailyMenuItemSales(date=date, menuitem_id=menuitem_id, **row) for (date, menuitem_id), row in menu.items()
+        )
+
+        crew = _totals([orders.filter(status=True, delivery_crew__isnull=False)
+                        .values('date', 'delivery_crew').annotate(delivered=Count('id')).order_by()
+                        for orders, _ in tables], ['date', 'delivery_crew'])
+        DailyCrewDeliveries.objects.bulk_create(
+            DailyCrewDeliveries(date=date, delivery_crew_id=crew_id, **row) for (date, crew_id), row in crew.items()
+        )
+
+
+def daily(**filters):
+    days = list(DailySales.objects.filter(**filters).order_by('date')
+                .values('date', 'orders', 'items', 'revenue', 'delivered'))
+    totals = {field: sum(day[field] for day in days) for field in ('orders', 'items', 'revenue', 'delivered')}
+    return {'totals': totals, 'days': days}
+
+
+def top_menu_items(limit, **filters):
+    return list(
+        DailyMenuItemSales.objects.filter(**filters)
+        .values('menuitem', title=F('menuitem__title'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'menuitem')[:limit]
+    )
+
+
+def crew_deliveries(**filters):
+    return list(
+        DailyCrewDeliveries.objects.filter(**filters)
+        .values('delivery_crew', username=F('delivery_crew__username'))
+        .annotate(delivered=Sum('delivered'))
+        .order_by('-delivered', 'delivery_crew')
+    )
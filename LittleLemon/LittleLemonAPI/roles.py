@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+# Roles are memoised on the user object for the lifetime of the request
+# (the same way Django's ModelBackend keeps ``_perm_cache``) and, when
+# ROLE_CACHE_TTL is set, in the shared cache across requests. Group changes
+# only evict that cache where it is shared, so settings.py leaves it at 0
+# unless every worker uses the same cache.
+ROLE_CACHE_TTL = getattr(settings, 'ROLE_CACHE_TTL', 0)
+
+
+def _cache_key(user_id):
+    return f'littlelemon:roles:{user_id}'
+
+
+def get_roles(user):
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles_cache', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = cache.get(key) if ROLE_CACHE_TTL else None
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            if ROLE_CACHE_TTL:
+                cache.set(key, roles, ROLE_CACHE_TTL)
+        user._roles_cache = roles
+    return roles
+
+
+async def aget_roles(user):
+    # Async twin of get_roles() for the ASGI read views; it fills the same
+    # per-request memo, so the sync permission classes cost nothing after it.
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles_cache', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = await cache.aget(key) if ROLE_CACHE_TTL else None
+        if roles is None:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            if ROLE_CACHE_TTL:
+                await cache.aset(key, roles, ROLE_CACHE_TTL)
+        user._roles_cache = roles
+    return roles
+
+
+def is_manager(user):
+    return MANAGER in get_roles(user)
+
+
+def is_delivery_crew(user):
+    return DELIVERY_CREW in get_roles(user)
+
+
+def invalidate_roles(user):
+    cache.delete(_cache_key(user.pk))
+    if hasattr(user, '_roles_cache'):
+        del user._roles_cache
+
+
+def invalidate_roles_for(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
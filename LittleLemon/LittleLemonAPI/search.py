@@ -0,0 +1,152 @@
+"""Full-text menu search over item and category titles.
+
+The index lives in its own table, ``menu_search``, one row per menu item:
+an FTS5 virtual table on SQLite and a tsvector column with a GIN index on
+PostgreSQL (migration 0011 creates whichever fits). The receivers at the
+bottom keep it in step with saves and deletes; writes that skip signals
+(``bulk_create()``, ``QuerySet.update()``, the seed command) are picked up
+with ``python manage.py rebuild_search``.
+
+``MenuSearchFilter`` turns ``?search=`` into a join against the index, so a
+search costs an index lookup rather than a LIKE scan of every item. Each
+word matches as a prefix ("chick" finds "Chicken Soup"), every word must
+match, and results are ranked with title matches ahead of category ones.
+Other database backends fall back to ``icontains``.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Category, MenuItem
+
+SEARCH_TABLE = 'menu_search'
+MAX_TERMS = 8
+
+# Relative weight of a title match over a category match.
+TITLE_WEIGHT = 4.0
+
+# The 'simple' configuration: menu titles are names, not prose to stem.
+POSTGRESQL_DOCUMENT = (
+    "setweight(to_tsvector('simple', m.title), 'A') || setweight(to_tsvector('simple', c.title), 'B')"
+)
+
+
+def supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _index(where, params):
+    # Replace the index rows of the menu items matching ``where`` with one
+    # INSERT ... SELECT from the menu tables.
+    items, categories = MenuItem._meta.db_table, Category._meta.db_table
+    key = 'rowid' if connection.vendor == 'sqlite' else 'menuitem_id'
+    if connection.vendor == 'sqlite':
+        insert = f"INSERT INTO {SEARCH_TABLE} (rowid, title, category) SELECT m.id, m.title, c.title"
+    else:
+        insert = f"INSERT INTO {SEARCH_TABLE} (menuitem_id, document) SELECT m.id, {POSTGRESQL_DOCUMENT}"
+    source = f'FROM "{items}" m JOIN "{categories}" c ON c.id = m.category_id'
+    with connection.cursor() as cursor:
+        if where:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN (SELECT m.id {source} WHERE {where})', params)
+        else:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(f'{insert} {source}' + (f' WHERE {where}' if where else ''), params)
+
+
+def index_items(ids):
+    if ids and supported():
+        _index('m.id IN (%s)' % ', '.join(['%s'] * len(ids)), list(ids))
+
+
+def index_category(category_id):
+    if supported():
+        _index('m.category_id = %s', [category_id])
+
+
+def unindex_items(ids):
+    if ids and supported():
+        key = 'rowid' if connection.vendor == 'sqlite' else 'menuitem_id'
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN (%s)' % ', '.join(['%s'] * len(ids)), list(ids))
+
+
+def rebuild():
+    """Reindex every menu item; returns the number indexed."""
+    if not supported():
+        return 0
+    with transaction.atomic():
+        _index('', [])
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            # Merge the b-tree segments left behind by incremental writes.
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return MenuItem.objects.count()
+
+
+def terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def search(queryset, text):
+    """Filter a MenuItem queryset to items matching ``text``, best match first."""
+    words = terms(text)
+    if not words:
+        return queryset.none()
+    vendor = connection.vendor
+    items = MenuItem._meta.db_table
+
+    if vendor == 'sqlite':
+        # bm25() is lower for better matches; the column weights favour titles.
+        # The ranks come from one MATCH, kept apart from the outer query by
+        # LIMIT -1 OFFSET 0 so SQLite materializes it once and looks rows up
+        # by rowid. Flattened, it would re-run the MATCH for every row.
+        match = ' '.join(f'"{word}"*' for word in words)
+        matches = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+        rank = (f'SELECT ranked.rank FROM (SELECT rowid, bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, 1.0) AS rank '
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT -1 OFFSET 0) ranked '
+                f'WHERE ranked.rowid = "{items}"."id"')
+    elif vendor == 'postgresql':
+        match = ' & '.join(f'{word}:*' for word in words)
+        weights = '{0.1, 0.2, %s, %s}' % (1.0 / TITLE_WEIGHT, 1.0)
+        matches = f"SELECT menuitem_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+        rank = (f"SELECT -ts_rank_cd('{weights}', document, to_tsquery('simple', %s)) FROM {SEARCH_TABLE} "
+                f'WHERE menuitem_id = "{items}"."id"')
+    if vendor in ('sqlite', 'postgresql'):
+        return (queryset.filter(id__in=RawSQL(matches, [match]))
+                .annotate(search_rank=RawSQL(rank, [match]))
+                .order_by('search_rank', 'id'))
+
+    for word in words:
+        queryset = queryset.filter(Q(title__icontains=word) | Q(category__title__icontains=word))
+    return queryset.order_by('title', 'id')
+
+
+class MenuSearchFilter(BaseFilterBackend):
+    """``?search=`` on the menu item list, answered from the full-text index."""
+
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        return search(queryset, text)
+
+
+# Receivers connected in LittlelemonapiConfig.ready().
+
+def menuitem_saved(sender, instance, **kwargs):
+    index_items([instance.pk])
+
+
+def menuitem_deleted(sender, instance, **kwargs):
+    unindex_items([instance.pk])
+
+
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_category(instance.pk)
@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from .models import MenuItem, Category, Cart, Order, OrderItem
+from .models import MenuItem, Category, Cart, Order, OrderItem, Job
 from decimal import Decimal
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 from django.contrib.auth.models import User, Group
+from rest_framework_simplejwt import serializers as jwt_serializers
+from .cart import MAX_QUANTITY, price_error
+from .roles import get_roles
 #import bleach
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,6 +13,15 @@ class UserSerializer(serializers.ModelSerializer):
         model=User
         fields = ['id', 'username', 'email']
 
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    # authentication.JWTAuthentication builds read-only users from these claims.
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['roles'] = sorted(get_roles(user))
+        return token
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -19,7 +31,6 @@ class MenuItemSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
     ordering_fields=['price','inventory']
-    search_fields=['title', 'category__title']
     
     class Meta:
         model = MenuItem
@@ -27,7 +38,7 @@ class MenuItemSerializer(serializers.ModelSerializer):
 
 class CartSerializer(serializers.ModelSerializer):
     menuitem_title = serializers.SerializerMethodField()
-    quantity = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
     unit_price = serializers.SerializerMethodField()
     price = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
     
@@ -35,6 +46,13 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['menuitem', 'menuitem_title', 'quantity', 'unit_price', 'price']
 
+    def validate(self, attrs):
+        # The line's price has to fit Cart.price, or the cart and its checkout break.
+        error = price_error(attrs['menuitem'].price * attrs['quantity'])
+        if error is not None:
+            raise serializers.ValidationError({"quantity": error})
+        return attrs
+
     def get_menuitem_title(self, cart):
         return cart.menuitem.title if cart.menuitem else None
     
@@ -61,20 +79,27 @@ class OrderItemSerializer(serializers.ModelSerializer):
     def get_menuitem_title(self, cart):
         return cart.menuitem.title if cart.menuitem else None
 
+def wants_items(request):
+    # Order items are only serialized for ?expand=items
+    return request is not None and 'items' in request.query_params.get('expand', '').split(',')
+
 class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(read_only=True, many=True)
+    items = OrderItemSerializer(source='orderitem_set', read_only=True, many=True)
     total = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True, required=False)
     delivery_crew = UserSerializer(read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'delivery_crew', 'status', 'items', 'total']
+        fields = ['id', 'user', 'delivery_crew', 'status', 'items', 'item_count', 'menuitem_count', 'total', 'version']
+        read_only_fields = ['item_count', 'menuitem_count', 'version']
     
     def get_fields(self):
         fields = super().get_fields()
         request = self.context.get('request')
         if request and request.method == 'POST':
             fields.pop('status', None)
+        if not wants_items(request):
+            fields.pop('items', None)
         return fields
     
     def create(self, validated_data):
@@ -90,3 +115,9 @@ class OrderSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         order = Order.objects.create(user=user, **validated_data)
         return order
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'payload', 'status', 'attempts', 'max_attempts', 'last_error', 'created', 'finished']
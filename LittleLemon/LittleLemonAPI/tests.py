@@ -1,3 +1,1305 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import runpy
+import time
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.test import APITestCase
+
+from LittleLemon import settings as settings_module
+
+from . import archive, async_views, authentication, jobs, push, reports, roles, search, throttling, views
+
+from .catalogue import bump_version
+from .fastpath import CartValues, MenuItemValues, OrderItemValues
+from .metrics import registry
+from .models import Category, MenuItem, Cart, Order, OrderItem, Job, DailySales, DailyMenuItemSales, DailyCrewDeliveries, ThrottleCounter, IdempotencyKey, ArchivedOrder, ArchivedOrderItem
+from .pagination import KeysetPagination
+from .roles import MANAGER, DELIVERY_CREW, get_roles
+from .serializers import CartSerializer, MenuItemSerializer, OrderItemSerializer
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LittleLemonTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager_group = Group.objects.create(name=MANAGER)
+        self.crew_group = Group.objects.create(name=DELIVERY_CREW)
+        self.manager = User.objects.create_user('manager', password='lemon@man!')
+        self.manager.groups.add(self.manager_group)
+        self.crew = User.objects.create_user('crew', password='lemon@crew!')
+        self.crew.groups.add(self.crew_group)
+        self.customer = User.objects.create_user('customer', password='lemon@cus!')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def login(self, user):
+        # A fresh instance per request, like the real authentication classes.
+        self.client.force_authenticate(User.objects.get(pk=user.pk))
+
+    def create_menu_items(self, count, category=None):
+        return MenuItem.objects.bulk_create(
+            MenuItem(title=f'Item {i}', price=Decimal('2.50') + i, featured=i % 2 == 0,
+                     category=category or self.category)
+            for i in range(count)
+        )
+
+    def create_order(self, user, items=(), delivery_crew=None, status=False):
+        order = Order.objects.create(user=user, delivery_crew=delivery_crew, status=status,
+                                     total=sum(item.price for item in items),
+                                     item_count=len(items), menuitem_count=len(items))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            for item in items
+        )
+        return order
+
+
+def group_queries(captured):
+    return [q['sql'] for q in captured.captured_queries if 'auth_user_groups' in q['sql']]
+
+
+class RoleResolutionTests(LittleLemonTestCase):
+
+    def test_roles_are_resolved_once_per_request(self):
+        order = self.create_order(self.customer, self.create_menu_items(2))
+        self.login(self.manager)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(f'/api/orders/{order.id}', {'status': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(group_queries(captured)), 1)
+
+    @mock.patch.object(roles, 'ROLE_CACHE_TTL', 300)
+    def test_roles_are_shared_across_requests(self):
+        get_roles(User.objects.get(pk=self.manager.pk))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(get_roles(User.objects.get(pk=self.manager.pk)), {MANAGER})
+        self.assertEqual(group_queries(captured), [])
+
+    def test_roles_are_not_shared_without_a_ttl(self):
+        # The default without a shared cache: a per-process cache would keep
+        # a demoted manager's role on the workers that did not demote them.
+        get_roles(User.objects.get(pk=self.manager.pk))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(get_roles(User.objects.get(pk=self.manager.pk)), {MANAGER})
+        self.assertEqual(len(group_queries(captured)), 1)
+
+    @mock.patch.object(roles, 'ROLE_CACHE_TTL', 300)
+    def test_group_changes_invalidate_cached_roles(self):
+        self.assertEqual(get_roles(User.objects.get(pk=self.customer.pk)), frozenset())
+        self.login(self.manager)
+        response = self.client.post('/api/groups/delivery-crew/users/', {'username': 'customer'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_roles(User.objects.get(pk=self.customer.pk)), {DELIVERY_CREW})
+
+        response = self.client.delete(f'/api/groups/delivery-crew/users/{self.customer.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(get_roles(User.objects.get(pk=self.customer.pk)), frozenset())
+
+
+class CheckoutTests(LittleLemonTestCase):
+
+    def fill_cart(self, user, items, quantity=2):
+        Cart.objects.bulk_create(
+            Cart(user=user, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity)
+            for item in items
+        )
+
+    def test_checkout_copies_cart_into_order(self):
+        items = self.create_menu_items(3)
+        self.fill_cart(self.customer, items)
+        self.login(self.customer)
+        response = self.client.post('/api/orders/', {'user': self.customer.pk})
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, sum(item.price * 2 for item in items))
+        self.assertEqual((order.item_count, order.menuitem_count), (6, 3))
+        self.assertEqual(order.orderitem_set.count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_checkout_query_count_does_not_grow_with_cart(self):
+        self.login(self.customer)
+        self.client.get('/api/orders/')  # warm the role cache
+        items = self.create_menu_items(30)
+        counts = []
+        for size in (1, 30):
+            self.fill_cart(self.customer, items[:size])
+            with CaptureQueriesContext(connection) as captured:
+                self.client.post('/api/orders/', {'user': self.customer.pk})
+            counts.append(len(captured.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_empty_cart_is_rejected(self):
+        self.login(self.customer)
+        response = self.client.post('/api/orders/', {'user': self.customer.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class QueryCountTests(LittleLemonTestCase):
+    """Listing more rows must not cost more queries."""
+
+    def assertConstantQueries(self, url, grow):
+        self.client.get(url)  # warm the role cache
+        bump_version()  # and bypass the catalogue response cache
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        grow()
+        bump_version()
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_menu_items(self):
+        self.create_menu_items(1)
+        self.login(self.customer)
+        self.assertConstantQueries('/api/menu-items/', lambda: self.create_menu_items(
+            10, Category.objects.create(slug='drinks', title='Drinks')))
+
+    def test_single_menu_item(self):
+        item = self.create_menu_items(1)[0]
+        self.login(self.customer)
+        self.assertConstantQueries(f'/api/menu-items/{item.pk}', lambda: None)
+
+    def test_cart(self):
+        items = self.create_menu_items(100)
+        Cart.objects.create(user=self.customer, menuitem=items[0], quantity=1,
+                            unit_price=items[0].price, price=items[0].price)
+        self.login(self.customer)
+        self.assertConstantQueries('/api/cart/menu-items/', lambda: Cart.objects.bulk_create(
+            Cart(user=self.customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            for item in items[1:]
+        ))
+
+    def test_orders(self):
+        items = self.create_menu_items(2)
+        self.create_order(self.customer, items, delivery_crew=self.crew)
+        self.login(self.manager)
+
+        def grow():
+            other_crew = User.objects.create_user('crew2')
+            for _ in range(10):
+                self.create_order(self.customer, items, delivery_crew=other_crew)
+
+        self.assertConstantQueries('/api/orders/', grow)
+
+    def test_orders_with_items(self):
+        items = self.create_menu_items(5)
+        self.create_order(self.customer, items[:1])
+        self.login(self.customer)
+        self.assertConstantQueries('/api/orders/?expand=items', lambda: [
+            self.create_order(self.customer, items) for _ in range(3)])
+
+    def test_order_detail(self):
+        items = self.create_menu_items(100)
+        order = self.create_order(self.customer, items[:1])
+        self.login(self.customer)
+        self.assertConstantQueries(f'/api/orders/{order.pk}', lambda: OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            for item in items[1:]
+        ))
+
+
+class CatalogueCacheTests(LittleLemonTestCase):
+
+    def test_repeated_reads_skip_the_database(self):
+        self.create_menu_items(3)
+        self.login(self.customer)
+        first = self.client.get('/api/menu-items/?ordering=price')
+        with CaptureQueriesContext(connection) as captured:
+            second = self.client.get('/api/menu-items/?ordering=price')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(captured.captured_queries, [])
+
+    def test_query_string_is_part_of_the_key(self):
+        self.create_menu_items(3)
+        self.login(self.customer)
+        self.client.get('/api/menu-items/?ordering=price')
+        response = self.client.get('/api/menu-items/?ordering=-price')
+        self.assertEqual(response.json()['results'][0]['title'], 'Item 2')
+
+    def test_etag_revalidation(self):
+        self.login(self.customer)
+        response = self.client.get('/api/category/')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get('/api/category/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_bump_the_version(self):
+        item = self.create_menu_items(1)[0]
+        self.login(self.manager)
+        etag = self.client.get(f'/api/menu-items/{item.pk}')['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.patch(f'/api/menu-items/{item.pk}', {'title': 'Lemon tart'})
+            self.assertEqual(response.status_code, 200)
+            # Nothing is invalidated until the write commits, and then once.
+            response = self.client.get(f'/api/menu-items/{item.pk}', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(callbacks, [bump_version])
+
+        response = self.client.get(f'/api/menu-items/{item.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Lemon tart')
+
+
+class OrderPaginationTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        items = self.create_menu_items(1)
+        self.orders = [self.create_order(self.customer, items) for _ in range(10)]
+        self.login(self.customer)
+
+    def walk(self, url, link='next'):
+        ids = []
+        while url:
+            body = self.client.get(url).json()
+            ids.extend(order['id'] for order in body['results'])
+            url = body[link]
+        return ids
+
+    def test_pages_walk_newest_first(self):
+        expected = [order.id for order in reversed(self.orders)]
+        self.assertEqual(self.walk('/api/orders/?page_size=3'), expected)
+
+    def test_previous_links_walk_back(self):
+        last = self.client.get('/api/orders/?page_size=3').json()
+        while last['next']:
+            last = self.client.get(last['next']).json()
+        ids = self.walk(last['previous'], link='previous')
+        self.assertEqual(sorted(ids), [order.id for order in self.orders[1:]])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 6):
+            body = self.client.get('/api/orders/?page_size=1000').json()
+        self.assertEqual(len(body['results']), 6)
+        self.assertEqual(body['count'], 10)
+
+    def test_forged_cursors_are_not_found(self):
+        encode = lambda position: base64.urlsafe_b64encode(json.dumps([position, False]).encode()).decode()
+        for position in (['abc', '1'], ['2024-01-01', 'x'], [1, 1], ['2024-01-01']):
+            response = self.client.get(f'/api/orders/?cursor={encode(position)}')
+            self.assertEqual(response.status_code, 404, position)
+        response = self.client.get(f"/api/orders/?cursor={encode(['2999-01-01', '1000000'])}")
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_count_can_be_skipped(self):
+        with CaptureQueriesContext(connection) as captured:
+            body = self.client.get('/api/orders/?count=false').json()
+        self.assertNotIn('count', body)
+        self.assertFalse(any('COUNT' in q['sql'] for q in captured.captured_queries))
+
+
+class OrderExportTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.items = self.create_menu_items(2)
+        self.assigned = self.create_order(self.customer, self.items, delivery_crew=self.crew)
+        self.unassigned = self.create_order(self.customer, self.items[:1])
+
+    def export(self, query=''):
+        self.login(self.manager)
+        response = self.client.get('/api/orders/export/' + query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_one_row_per_item(self):
+        lines = self.export().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'date'])
+        self.assertEqual(len(lines), 1 + 3)
+
+    def test_ndjson_groups_items_per_order(self):
+        orders = [json.loads(line) for line in self.export('?output=ndjson').splitlines()]
+        self.assertEqual([order['id'] for order in orders], [self.assigned.id, self.unassigned.id])
+        self.assertEqual(len(orders[0]['items']), 2)
+        self.assertEqual(orders[0]['total'], str(self.assigned.total))
+
+    def test_filters(self):
+        orders = self.export(f'?output=ndjson&delivery_crew={self.crew.pk}').splitlines()
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(self.export('?output=ndjson&date_to=2000-01-01'), '')
+
+    def test_managers_only(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, 403)
+
+
+class CartBulkTests(LittleLemonTestCase):
+
+    def test_upserts_and_removals_in_one_request(self):
+        items = self.create_menu_items(3)
+        Cart.objects.create(user=self.customer, menuitem=items[0], quantity=1,
+                            unit_price=items[0].price, price=items[0].price)
+        Cart.objects.create(user=self.customer, menuitem=items[1], quantity=1,
+                            unit_price=items[1].price, price=items[1].price)
+        self.login(self.customer)
+        response = self.client.post('/api/cart/menu-items/bulk/', {'lines': [
+            {'menuitem': items[0].pk, 'quantity': 3},
+            {'menuitem': items[1].pk, 'quantity': 0},
+            {'menuitem': items[2].pk, 'quantity': 2},
+            {'menuitem': 999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['status'] for line in response.json()['results']],
+                         ['saved', 'removed', 'saved', 'error'])
+
+        cart = dict(Cart.objects.filter(user=self.customer).values_list('menuitem_id', 'quantity'))
+        self.assertEqual(cart, {items[0].pk: 3, items[2].pk: 2})
+        self.assertEqual(Cart.objects.get(menuitem=items[0]).price, items[0].price * 3)
+
+    def test_lines_must_fit_the_price_column(self):
+        item, other = (MenuItem.objects.create(title=title, price=Decimal('950.00'), featured=False, category=self.category)
+                       for title in ('Platter', 'Feast'))
+        self.login(self.customer)
+        response = self.client.post('/api/cart/menu-items/bulk/', [
+            {'menuitem': item.pk, 'quantity': 11},
+            {'menuitem': item.pk, 'quantity': 32767},
+        ], format='json')
+        self.assertEqual([line['status'] for line in response.json()['results']], ['error', 'error'])
+        response = self.client.post('/api/cart/menu-items/', {'menuitem': item.pk, 'quantity': 11})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+        self.client.post('/api/cart/menu-items/bulk/', [{'menuitem': item.pk, 'quantity': 10}], format='json')
+        self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 200)
+        self.assertEqual(self.client.post('/api/orders/', {'user': self.customer.pk}).status_code, 201)
+
+        # Lines that fit on their own can still add up past Order.total.
+        self.client.post('/api/cart/menu-items/bulk/', [{'menuitem': item.pk, 'quantity': 10},
+                                                        {'menuitem': other.pk, 'quantity': 10}], format='json')
+        self.assertEqual(self.client.post('/api/orders/', {'user': self.customer.pk}).status_code, 400)
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        items = self.create_menu_items(15)
+        self.login(self.customer)
+        self.client.get('/api/cart/menu-items/')  # warm the role cache
+        self.client.get('/api/menu-items/')  # and the catalogue snapshot
+        counts = []
+        for size in (1, 15):
+            lines = [{'menuitem': item.pk, 'quantity': 2} for item in items[:size]]
+            with CaptureQueriesContext(connection) as captured:
+                self.client.post('/api/cart/menu-items/bulk/', {'lines': lines}, format='json')
+            counts.append(len(captured.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rejects_empty_payload(self):
+        self.login(self.customer)
+        response = self.client.post('/api/cart/menu-items/bulk/', {'lines': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderSummaryTests(LittleLemonTestCase):
+
+    def test_listing_carries_a_summary_without_items(self):
+        self.create_order(self.customer, self.create_menu_items(3))
+        self.login(self.customer)
+        order = self.client.get('/api/orders/').json()['results'][0]
+        self.assertEqual((order['item_count'], order['menuitem_count']), (3, 3))
+        self.assertNotIn('items', order)
+
+    def test_items_are_expanded_on_request(self):
+        self.create_order(self.customer, self.create_menu_items(3))
+        self.login(self.customer)
+        order = self.client.get('/api/orders/?expand=items').json()['results'][0]
+        self.assertEqual([item['menuitem_title'] for item in order['items']], ['Item 0', 'Item 1', 'Item 2'])
+
+
+class MetricsTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_requests_are_recorded_per_route_and_role(self):
+        self.create_menu_items(2)
+        self.login(self.customer)
+        self.client.get('/api/menu-items/')
+        self.login(self.manager)
+        self.client.get('/api/orders/')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('littlelemon_request_duration_seconds_count{route="api/menu-items/",'
+                      'view="LittleLemonAPI.views.MenuItemsView",method="GET",role="customer"} 1', body)
+        self.assertIn('role="manager",status="200"} 1', body)
+        self.assertIn('littlelemon_db_queries_sum{route="api/orders/"', body)
+
+    async def test_queries_are_counted_under_asgi(self):
+        token = await Token.objects.acreate(user=self.customer)
+        await sync_to_async(self.create_order)(self.customer)
+        await self.async_client.get('/api/orders/', headers={'Authorization': f'Token {token.key}'})
+        stats, = registry.routes.values()
+        self.assertEqual(stats.queries.count, 1)
+        self.assertGreater(stats.queries.total, 0)
+        self.assertGreater(stats.db_time.total, 0)
+
+    def test_role_queries_count_towards_the_request(self):
+        self.login(self.customer)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/menu-items/')
+        self.assertTrue(group_queries(captured))
+        stats, = registry.routes.values()
+        self.assertEqual(stats.queries.total, len(captured.captured_queries))
+
+    def test_slow_requests_are_logged(self):
+        self.login(self.customer)
+        with mock.patch('LittleLemonAPI.metrics.METRICS_SLOW_REQUEST_MS', 0), \
+                self.assertLogs('LittleLemonAPI.slow', 'WARNING') as logs:
+            self.client.get('/api/orders/')
+        self.assertIn('Slow request GET /api/orders/', logs.output[0])
+
+
+class AsyncReadTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.customer)
+        self.factory = AsyncRequestFactory()
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    async def call(self, view_class, method='get', path='/', data=None, **kwargs):
+        view = async_views.read_view(view_class, getattr(async_views, view_class.__name__))
+        request = getattr(self.factory, method)(path, data, content_type='application/json', headers=self.headers)
+        return await view(request, **kwargs)
+
+    async def test_menu_matches_the_sync_view(self):
+        await sync_to_async(self.create_menu_items)(3)
+        response = await self.call(views.MenuItemsView, path='/api/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response['ETag'])
+        await sync_to_async(self.login)(self.customer)
+        expected = await sync_to_async(self.client.get)('/api/menu-items/')
+        self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_single_item_and_missing_item(self):
+        item, = await sync_to_async(self.create_menu_items)(1)
+        response = await self.call(views.SingleMenuItem, path=f'/api/menu-items/{item.pk}', pk=item.pk)
+        self.assertEqual(json.loads(response.content)['title'], 'Item 0')
+        response = await self.call(views.SingleMenuItem, path='/api/menu-items/0', pk=0)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_orders_are_filtered_by_role(self):
+        await sync_to_async(self.create_order)(self.customer)
+        await sync_to_async(self.create_order)(self.manager)
+        response = await self.call(views.OrderView, path='/api/orders/')
+        body = json.loads(response.content)
+        self.assertEqual(body['count'], 1)
+        self.assertEqual(body['results'][0]['user'], self.customer.pk)
+
+    async def test_order_history_includes_the_archive(self):
+        order = await sync_to_async(self.create_order)(self.customer, status=True)
+        await Order.objects.filter(pk=order.pk).aupdate(date=timezone.localdate() - timedelta(days=365))
+        await sync_to_async(archive.archive_orders)()
+        response = await self.call(views.OrderView, path='/api/orders/', data={'history': 1})
+        body = json.loads(response.content)
+        self.assertEqual((body['count'], body['results'][0]['id']), (1, order.pk))
+
+    async def test_unauthenticated_and_writes(self):
+        headers, self.headers = self.headers, {}
+        response = await self.call(views.OrderView, path='/api/orders/')
+        self.assertEqual(response.status_code, 401)
+
+        self.headers = headers
+        response = await self.call(views.MenuCategoryView, method='post', path='/api/category/',
+                                   data={'slug': 'drinks', 'title': 'Drinks'})
+        self.assertEqual(response.status_code, 403)
+
+
+class AuthenticationCacheTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_menu_items(2)
+        self.token = Token.objects.create(user=self.customer)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @mock.patch.object(authentication, 'ROLE_CACHE_TTL', 300)
+    @mock.patch.object(roles, 'ROLE_CACHE_TTL', 300)
+    def test_warm_menu_get_runs_no_queries(self):
+        # With a shared cache the token, user and roles all come from it.
+        self.client.get('/api/menu-items/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(captured.captured_queries, [])
+
+    def test_logout_evicts_the_token(self):
+        self.assertEqual(self.client.get('/api/menu-items/').status_code, 200)
+        self.assertEqual(self.client.post('/auth/token/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/api/menu-items/').status_code, 401)
+
+    def test_group_changes_evict_cached_roles(self):
+        self.assertEqual(self.client.get('/api/groups/manager/users/').status_code, 403)
+        self.manager_group.user_set.add(self.customer)
+        self.assertEqual(self.client.get('/api/groups/manager/users/').status_code, 200)
+        self.customer.groups.clear()
+        self.assertEqual(self.client.get('/api/groups/manager/users/').status_code, 403)
+
+    def test_deactivated_users_are_rejected(self):
+        self.client.get('/api/menu-items/')
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get('/api/menu-items/').status_code, 401)
+
+    def test_jwt_reads_use_claims(self):
+        response = self.client.post('/token/login/', {'username': 'manager', 'password': 'lemon@man!'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.client.get('/api/menu-items/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(captured.captured_queries, [])
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/category/', {'slug': 'drinks', 'title': 'Drinks'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue([q for q in captured.captured_queries if 'auth_user' in q['sql']])
+
+
+class JobQueueTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.failures = 0
+        jobs.handlers['test.flaky'] = self.flaky
+
+    def tearDown(self):
+        del jobs.handlers['test.flaky']
+
+    def flaky(self, fail_times):
+        if self.failures < fail_times:
+            self.failures += 1
+            raise RuntimeError('provider is down')
+
+    def test_checkout_and_status_changes_enqueue_events(self):
+        item, = self.create_menu_items(1)
+        Cart.objects.create(user=self.customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+        self.login(self.customer)
+        order_id = self.client.post('/api/orders/', {'user': self.customer.pk}).json()['id']
+        order = Order.objects.get(pk=order_id)
+        order.delivery_crew = self.crew
+        order.save()
+
+        self.login(self.crew)
+        self.client.patch(f'/api/orders/{order_id}', {'status': 1})
+        self.client.patch(f'/api/orders/{order_id}', {'status': 1})
+        self.assertEqual(
+            list(Job.objects.order_by('id').values_list('name', 'payload')),
+            [('order.created', {'order_id': order_id}),
+             ('order.status_changed', {'order_id': order_id, 'status': True, 'delivery_crew': self.crew.pk,
+                                       'previous_status': False, 'previous_crew': self.crew.pk})])
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_failures_are_retried_with_backoff(self):
+        job = jobs.enqueue('test.flaky', fail_times=1)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('provider is down', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+    def test_dead_letters_can_be_listed_and_requeued(self):
+        job = jobs.enqueue('test.flaky', max_attempts=1, fail_times=1)
+        with self.assertLogs('LittleLemonAPI.jobs', 'ERROR'):
+            jobs.run_pending()
+
+        self.login(self.customer)
+        self.assertEqual(self.client.get('/api/jobs/dead/').status_code, 403)
+        self.login(self.manager)
+        self.assertEqual([row['id'] for row in self.client.get('/api/jobs/dead/').json()], [job.pk])
+        self.assertEqual(self.client.post('/api/jobs/dead/', {'ids': [job.pk]}, format='json').json(), {'requeued': 1})
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_abandoned_jobs_are_released_until_out_of_attempts(self):
+        job = jobs.enqueue('test.flaky', max_attempts=2, fail_times=0)
+        pool = jobs.WorkerPool()
+
+        def abandon():
+            jobs.claim('lost')
+            Job.objects.filter(pk=job.pk).update(
+                locked_at=timezone.now() - timedelta(seconds=jobs.JOBS_LOCK_TIMEOUT + 1))
+            pool.released_at = None
+
+        abandon()
+        self.assertEqual(pool.release_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.PENDING, 1, ''))
+
+        abandon()
+        with self.assertLogs('LittleLemonAPI.jobs', 'ERROR'):
+            self.assertEqual(pool.release_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        self.assertIn('did not finish', job.last_error)
+
+        # Between sweeps, a pool leaves the table alone.
+        self.assertEqual(pool.release_stale(), 0)
+
+
+class DispatchTests(LittleLemonTestCase):
+
+    def test_orders_are_spread_by_open_load(self):
+        crew2 = User.objects.create_user('crew2')
+        crew2.groups.add(self.crew_group)
+        self.create_order(self.customer, delivery_crew=self.crew)
+        self.create_order(self.customer, delivery_crew=self.crew, status=True)
+        pending = [self.create_order(self.customer) for _ in range(5)]
+        delivered = self.create_order(self.customer, status=True)
+
+        self.login(self.manager)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/orders/dispatch/', {}, format='json')
+        self.assertEqual(response.json()['assigned'], 5)
+        self.assertLessEqual(len(captured.captured_queries), 8)
+
+        open_load = dict(Order.objects.filter(status=False).values_list('delivery_crew')
+                         .annotate(n=Count('id')).order_by())
+        self.assertEqual(open_load, {self.crew.pk: 3, crew2.pk: 3})
+        self.assertEqual(Order.objects.filter(pk__in=[o.pk for o in pending], delivery_crew=None).count(), 0)
+        delivered.refresh_from_db()
+        self.assertIsNone(delivered.delivery_crew)
+
+    def test_limit_and_permissions(self):
+        for _ in range(3):
+            self.create_order(self.customer)
+        self.login(self.crew)
+        self.assertEqual(self.client.post('/api/orders/dispatch/').status_code, 403)
+        self.login(self.manager)
+        self.assertEqual(self.client.post('/api/orders/dispatch/', {'limit': 0}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/orders/dispatch/', {'limit': 2}, format='json').json()['assigned'], 2)
+
+
+class OrderPushTests(LittleLemonTestCase):
+
+    async def test_events_reach_the_owner_crew_and_managers(self):
+        broker = push.InProcessBroker()
+        customer, crew, manager, other = (broker.subscribe(1), broker.subscribe(2),
+                                          broker.subscribe(3, manager=True), broker.subscribe(4))
+        broker.publish({'order': 7}, [1, 2])
+        await asyncio.sleep(0)
+        for subscription in (customer, crew, manager):
+            self.assertEqual(await subscription.next(0), {'order': 7})
+        self.assertIsNone(await other.next(0))
+
+        stream = push.stream(broker, customer)
+        await anext(stream)
+        await stream.aclose()
+        self.assertNotIn(1, broker.by_user)
+
+    async def test_stream_sends_status_changes(self):
+        order = await sync_to_async(self.create_order)(self.customer, delivery_crew=self.crew)
+        token = await Token.objects.acreate(user=self.customer)
+        request = AsyncRequestFactory().get('/api/orders/events/', headers={'Authorization': f'Token {token.key}'})
+        response = await async_views.OrderEventsView.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        def deliver():
+            self.login(self.crew)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/orders/{order.pk}', {'status': 1})
+        await sync_to_async(deliver)()
+
+        chunk = await asyncio.wait_for(anext(chunks), 1)
+        self.assertEqual(chunk, b'event: order\ndata: {"order": %d, "status": true, "delivery_crew": %d}\n\n'
+                         % (order.pk, self.crew.pk))
+        await response._iterator.aclose()
+
+
+class SalesReportTests(LittleLemonTestCase):
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.order_by('date').values_list('date', 'orders', 'items', 'revenue', 'delivered')),
+            list(DailyMenuItemSales.objects.order_by('date', 'menuitem').values_list('date', 'menuitem', 'quantity', 'revenue')),
+            list(DailyCrewDeliveries.objects.order_by('date', 'delivery_crew').values_list('date', 'delivery_crew', 'delivered')),
+        )
+
+    def test_jobs_update_rollups_like_a_rebuild(self):
+        first, second = self.create_menu_items(2)
+        self.login(self.customer)
+        for quantity in (1, 3):
+            Cart.objects.create(user=self.customer, menuitem=first, quantity=quantity,
+                                unit_price=first.price, price=first.price * quantity)
+            Cart.objects.create(user=self.customer, menuitem=second, quantity=1, unit_price=second.price, price=second.price)
+            self.client.post('/api/orders/', {'user': self.customer.pk})
+        order = Order.objects.earliest('id')
+        order.delivery_crew = self.crew
+        order.save()
+        self.login(self.crew)
+        self.client.patch(f'/api/orders/{order.pk}', {'status': 1})
+        jobs.run_pending()
+
+        incremental = self.rollups()
+        (day, orders, items, revenue, delivered), = incremental[0]
+        self.assertEqual((orders, items, delivered), (2, 6, 1))
+        self.assertEqual(revenue, first.price * 4 + second.price * 2)
+        self.assertEqual(incremental[2], [(day, self.crew.pk, 1)])
+
+        DailySales.objects.update(orders=0)
+        self.assertEqual(reports.rebuild(chunk_days=1), 1)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_reassigning_delivered_orders_moves_their_deliveries(self):
+        other = User.objects.create_user('other', password='lemon@crew!')
+        other.groups.add(self.crew_group)
+        items = self.create_menu_items(1)
+        assigned = self.create_order(self.customer, items, delivery_crew=self.crew)
+        unassigned = self.create_order(self.customer, items)
+        self.login(self.crew)
+        self.client.patch(f'/api/orders/{assigned.pk}', {'status': 1})
+        self.login(self.manager)
+        self.client.patch(f'/api/orders/{unassigned.pk}', {'status': 1})
+        jobs.run_pending()
+
+        # Delivered by crew, then credited to other; delivered by nobody, then credited to crew.
+        self.client.patch(f'/api/orders/{assigned.pk}', {'delivery_crew': other.pk})
+        self.client.patch(f'/api/orders/{unassigned.pk}', {'delivery_crew': self.crew.pk})
+        jobs.run_pending()
+
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        (day, delivered), = DailySales.objects.values_list('date', 'delivered')
+        crew = self.rollups()[2]
+        self.assertEqual((delivered, crew), (2, [(day, self.crew.pk, 1), (day, other.pk, 1)]))
+        reports.rebuild()
+        self.assertEqual(self.rollups()[2], crew)
+        self.assertEqual(DailySales.objects.get().delivered, 2)
+
+    def test_status_jobs_run_out_of_order(self):
+        order = self.create_order(self.customer, self.create_menu_items(1), delivery_crew=self.crew)
+        self.login(self.crew)
+        self.client.patch(f'/api/orders/{order.pk}', {'status': 1})
+        self.client.patch(f'/api/orders/{order.pk}', {'status': 0})
+        delivered, undelivered = Job.objects.filter(name=jobs.ORDER_STATUS_CHANGED).order_by('id')
+
+        # A retry's backoff can hold the earlier change back past the later one.
+        Job.objects.filter(pk=delivered.pk).update(run_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(jobs.run_pending(), 1)
+        Job.objects.filter(pk=delivered.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+
+        self.assertEqual(DailySales.objects.get().delivered, 0)
+        self.assertFalse(DailyCrewDeliveries.objects.exists())
+
+    def test_reports_read_only_the_rollups(self):
+        items = self.create_menu_items(3)
+        self.create_order(self.customer, items, delivery_crew=self.crew, status=True)
+        self.create_order(self.customer, items[:1])
+        reports.rebuild()
+
+        self.login(self.customer)
+        self.assertEqual(self.client.get('/api/reports/daily/').status_code, 403)
+        self.login(self.manager)
+        with CaptureQueriesContext(connection) as captured:
+            daily = self.client.get('/api/reports/daily/').json()
+            top = self.client.get('/api/reports/menu-items/', {'limit': 1}).json()
+            crew = self.client.get('/api/reports/crew/').json()
+        self.assertFalse([q for q in captured.captured_queries if '_order' in q['sql']])
+        self.assertEqual((daily['totals']['orders'], daily['totals']['items']), (2, 4))
+        self.assertEqual([(row['menuitem'], row['quantity']) for row in top], [(items[0].pk, 2)])
+        self.assertEqual(crew, [{'delivery_crew': self.crew.pk, 'username': 'crew', 'delivered': 1}])
+
+        self.assertEqual(self.client.get('/api/reports/daily/', {'date_from': '2000-01-01', 'date_to': '2000-12-31'}).json()['days'], [])
+        self.assertEqual(self.client.get('/api/reports/crew/', {'date_to': 'soon'}).status_code, 400)
+
+
+class MenuSearchTests(LittleLemonTestCase):
+
+    def create_item(self, title, category=None):
+        return MenuItem.objects.create(title=title, price=Decimal('5.00'), featured=False,
+                                       category=category or self.category)
+
+    def search(self, text, **params):
+        response = self.client.get('/api/menu-items/', {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_prefix_matches_ranked_title_first(self):
+        soups = Category.objects.create(slug='soups', title='Chicken Soups')
+        self.create_item('Lemon Chicken')
+        self.create_item('Tomato', category=soups)
+        self.create_item('Greek Salad')
+        self.login(self.customer)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.search('chick'), ['Lemon Chicken', 'Tomato'])
+        self.assertFalse([q for q in captured.captured_queries if 'LIKE' in q['sql']])
+        self.assertEqual(self.search('Chick SOUP'), ['Tomato'])
+        self.assertEqual(self.search('pasta'), [])
+        self.assertEqual(self.search('"*'), [])
+
+        # The snapshot's filters still apply when the search goes to the database.
+        self.assertEqual(self.search('chick', category='soups'), ['Tomato'])
+        self.assertEqual(self.search('chick', category=self.category.pk), ['Lemon Chicken'])
+        self.assertEqual(self.search('chick', featured='true'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        item = self.create_item('Bruschetta')
+        self.login(self.customer)
+        self.assertEqual(self.search('brus'), ['Bruschetta'])
+
+        item.title = 'Garlic Bread'
+        item.save()
+        self.category.title = 'Starters'
+        self.category.save()
+        bump_version()
+        self.assertEqual(self.search('brus'), [])
+        self.assertEqual(self.search('garlic start'), ['Garlic Bread'])
+
+        item.delete()
+        bump_version()
+        self.assertEqual(self.search('garlic'), [])
+
+    def test_rebuild_indexes_bulk_created_items(self):
+        self.create_menu_items(3)
+        self.login(self.customer)
+        self.assertEqual(self.search('item'), [])
+        call_command('rebuild_search', stdout=io.StringIO())
+        self.assertEqual(self.search('item'), ['Item 0', 'Item 1', 'Item 2'])
+
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks the SQLite query plan.')
+    def test_ranking_runs_the_match_once(self):
+        self.create_menu_items(3000)
+        search.rebuild()
+        queryset = search.search(MenuItem.objects.all(), 'item')
+
+        # One scan of the index for the filter and one for the ranks; a
+        # MATCH constrained to each row's rowid would run once per match.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = [step for step in plan if 'VIRTUAL TABLE' in step]
+        self.assertEqual(len(scans), 2, plan)
+        self.assertFalse([step for step in scans if ':=' in step], plan)
+
+        started = time.perf_counter()
+        self.assertEqual(len(list(queryset[:4])), 4)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+class FastSerializerContractTests(LittleLemonTestCase):
+    # The values() serializers must stay interchangeable with the DRF ones.
+
+    def assertSameOutput(self, serializer_class, fast, queryset):
+        expected = serializer_class(queryset, many=True).data
+        actual = fast.many(fast.values(queryset))
+        self.assertEqual(json.dumps(actual, cls=JSONEncoder), json.dumps(expected, cls=JSONEncoder))
+        self.assertEqual(actual, [dict(row) for row in expected])
+
+    def test_outputs_match_the_drf_serializers(self):
+        items = self.create_menu_items(3)
+        items[0].price = Decimal('7.5')
+        items[0].save()
+        for quantity, item in enumerate(items, 1):
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=quantity,
+                                unit_price=item.price, price=item.price * quantity)
+        order = self.create_order(self.customer, items)
+
+        self.assertSameOutput(MenuItemSerializer, MenuItemValues, MenuItem.objects.select_related('category').order_by('id'))
+        self.assertSameOutput(CartSerializer, CartValues, Cart.objects.select_related('menuitem').order_by('id'))
+        self.assertSameOutput(OrderItemSerializer, OrderItemValues, order.orderitem_set.select_related('menuitem').order_by('id'))
+
+    def test_list_views_use_the_fast_path(self):
+        item, = self.create_menu_items(1)
+        Cart.objects.create(user=self.customer, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+        self.login(self.customer)
+        with mock.patch.object(MenuItemSerializer, 'to_representation') as menu, \
+                mock.patch.object(CartSerializer, 'to_representation') as cart:
+            menu_items = self.client.get('/api/menu-items/').json()['results']
+            cart_lines = self.client.get('/api/cart/menu-items/').json()['results']
+        self.assertFalse(menu.called or cart.called)
+        self.assertEqual(menu_items[0]['price'], '2.50')
+        self.assertEqual(cart_lines[0], {'menuitem': item.pk, 'menuitem_title': 'Item 0', 'quantity': 2,
+                                         'unit_price': 2.5, 'price': '5.00'})
+
+
+class ThrottlingTests(LittleLemonTestCase):
+
+    def test_user_rate_headers_and_retry_after(self):
+        self.login(self.customer)
+        with mock.patch.object(throttling.UserRateThrottle, 'THROTTLE_RATES', {'user': '3/minute', 'anon': None}):
+            responses = [self.client.get('/api/category/') for _ in range(4)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200, 429])
+        self.assertEqual([r['X-RateLimit-Remaining'] for r in responses], ['2', '1', '0', '0'])
+        self.assertEqual(responses[0]['X-RateLimit-Limit'], '3')
+        self.assertGreater(int(responses[3]['Retry-After']), 0)
+
+    def test_scoped_rate_applies_per_view(self):
+        # CartBulkView has throttle_scope 'ten', counted apart from the user rate.
+        self.login(self.customer)
+        rates = {'user': '100/minute', 'ten': '1/minute', 'anon': None}
+        with mock.patch.object(throttling.UserRateThrottle, 'THROTTLE_RATES', rates), \
+                mock.patch.object(throttling.ScopedRateThrottle, 'THROTTLE_RATES', rates):
+            lines = {'lines': [{'menuitem': 0, 'quantity': 1}]}
+            first = self.client.post('/api/cart/menu-items/bulk/', lines, format='json')
+            second = self.client.post('/api/cart/menu-items/bulk/', lines, format='json')
+            menu = self.client.get('/api/category/')
+        self.assertNotEqual(first.status_code, 429)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual((menu.status_code, menu['X-RateLimit-Limit']), (200, '100'))
+
+    def test_sliding_window_weights_the_previous_window(self):
+        throttle = throttling.UserRateThrottle()
+        throttle.num_requests, throttle.duration, throttle.window = 10, 60, 'sliding'
+        view = mock.Mock(headers={})
+        # 15 seconds into a window: 3/4 of the previous window's 8 still count.
+        self.assertTrue(throttle.decide(view, 15, 4, 8))
+        self.assertEqual(view.headers['X-RateLimit-Remaining'], '0')
+        self.assertFalse(throttle.decide(mock.Mock(headers={}), 15, 5, 8))
+        # One more fits once 8 * (1 - (15 + t) / 60) <= 10 - 1 - 5, i.e. after 15s.
+        self.assertEqual(throttle.wait(), 15)
+        throttle.window = 'fixed'
+        self.assertTrue(throttle.decide(mock.Mock(headers={}), 15, 5, 8))
+
+    def test_database_store_keeps_one_row_per_client(self):
+        store = throttling.DatabaseStore()
+        self.assertEqual([store.hit('a', 10, 60) for _ in range(3)], [(1, 0), (2, 0), (3, 0)])
+        self.assertEqual(store.hit('a', 11, 60), (1, 3))
+        self.assertEqual(store.hit('a', 11, 60), (2, 3))
+        self.assertEqual(store.hit('a', 13, 60), (1, 0))
+        store.hit('b', int(time.time() // 60), 60)
+        self.assertEqual(ThrottleCounter.objects.count(), 2)
+        self.assertEqual(store.prune(), 1)
+
+    async def test_async_views_count_in_the_database_store(self):
+        token = await Token.objects.acreate(user=self.customer)
+        request = AsyncRequestFactory().get('/api/category/', headers={'Authorization': f'Token {token.key}'})
+        with mock.patch.object(throttling, '_store', throttling.DatabaseStore()):
+            response = await async_views.MenuCategoryView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Limit'], '10')
+        self.assertEqual(await ThrottleCounter.objects.acount(), 1)
+
+
+class CatalogueSnapshotTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.drinks = Category.objects.create(slug='drinks', title='Drinks')
+        self.items = self.create_menu_items(4) + self.create_menu_items(2, self.drinks)
+        self.login(self.customer)
+
+    def titles(self, url):
+        return [item['title'] for item in self.client.get(url).json()['results']]
+
+    def test_menu_reads_need_no_queries(self):
+        self.client.get('/api/menu-items/')  # load the snapshot, warm the role cache
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.titles(f'/api/menu-items/?category={self.drinks.pk}'), ['Item 0', 'Item 1'])
+            self.assertEqual(self.titles('/api/menu-items/?category=drinks&ordering=-price'), ['Item 1', 'Item 0'])
+            self.assertEqual(self.titles('/api/menu-items/?featured=true&category=mains'), ['Item 0', 'Item 2'])
+            self.assertEqual(self.titles('/api/menu-items/?ordering=-price&page=2'), ['Item 0', 'Item 0'])
+            self.assertEqual(self.titles('/api/menu-items/?category=nope'), [])
+            self.assertEqual(self.client.get(f'/api/menu-items/{self.items[5].pk}').json()['category']['slug'], 'drinks')
+            self.assertEqual(len(self.client.get('/api/category/').json()['results']), 2)
+        self.assertEqual(captured.captured_queries, [])
+        self.assertEqual(self.client.get('/api/menu-items/0').status_code, 404)
+
+    def test_listing_matches_the_serializer(self):
+        expected = MenuItemSerializer(MenuItem.objects.select_related('category').order_by('id'), many=True).data
+        response = self.client.get('/api/menu-items/?page_size=100')
+        self.assertEqual(response.json()['count'], 6)
+        pages = self.titles('/api/menu-items/') + self.titles('/api/menu-items/?page=2')
+        self.assertEqual(pages, [item['title'] for item in expected])
+        self.assertEqual(self.client.get('/api/menu-items/').json()['results'], json.loads(json.dumps(expected[:4], cls=JSONEncoder)))
+
+    def test_stale_snapshots_do_not_price_carts(self):
+        # Another worker's write: the version bump is never seen here.
+        self.client.get('/api/menu-items/')
+        new = MenuItem.objects.create(title='New', price=Decimal('4.00'), featured=False, category=self.category)
+        MenuItem.objects.filter(pk=self.items[0].pk).update(price=Decimal('7.00'))
+
+        self.assertEqual(self.client.get(f'/api/menu-items/{new.pk}').json()['title'], 'New')
+        self.assertEqual(self.client.post('/api/cart/menu-items/', {'menuitem': new.pk, 'quantity': 1}).status_code, 201)
+        response = self.client.post('/api/cart/menu-items/bulk/', [{'menuitem': self.items[0].pk, 'quantity': 2}],
+                                    format='json')
+        self.assertEqual(response.json()['results'][0]['price'], '14.00')
+        self.assertEqual(dict(Cart.objects.values_list('menuitem_id', 'price')),
+                         {new.pk: Decimal('4.00'), self.items[0].pk: Decimal('14.00')})
+
+    def test_menu_writes_reload_the_snapshot(self):
+        item = self.items[0]
+        self.client.get('/api/menu-items/')
+        with self.captureOnCommitCallbacks(execute=True):
+            item.price = Decimal('99.00')
+            item.save()
+        self.assertEqual(self.client.get(f'/api/menu-items/{item.pk}').json()['price'], '99.00')
+
+        response = self.client.post('/api/cart/menu-items/', {'menuitem': item.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.get(user=self.customer).price, Decimal('198.00'))
+
+
+class IdempotencyTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.item, = self.create_menu_items(1)
+        self.login(self.customer)
+
+    def fill_cart(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=1,
+                            unit_price=self.item.price, price=self.item.price)
+
+    def test_retried_checkout_replays_the_first_order(self):
+        headers = {'Idempotency-Key': 'checkout-1'}
+        self.fill_cart()
+        first = self.client.post('/api/orders/', {'user': self.customer.pk}, headers=headers)
+        self.assertEqual(first.status_code, 201)
+        self.fill_cart()
+        retry = self.client.post('/api/orders/', {'user': self.customer.pk}, headers=headers)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(Cart.objects.filter(user=self.customer).exists())
+
+        other = self.client.post('/api/orders/', {'user': self.manager.pk}, headers=headers)
+        self.assertEqual(other.status_code, 422)
+
+        # Another user's key space is separate.
+        self.login(self.manager)
+        self.assertEqual(self.client.post('/api/orders/', {'user': self.manager.pk}, headers=headers).status_code, 400)
+
+    def test_failed_requests_can_be_retried_with_the_same_key(self):
+        headers = {'Idempotency-Key': 'checkout-2'}
+        data = {'user': self.customer.pk}
+        self.assertEqual(self.client.post('/api/orders/', data, headers=headers).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.fill_cart()
+        self.assertEqual(self.client.post('/api/orders/', data, headers=headers).status_code, 201)
+
+    def test_cart_writes_run_once(self):
+        headers = {'Idempotency-Key': 'cart-1'}
+        for _ in range(2):
+            response = self.client.post('/api/cart/menu-items/bulk/',
+                                        [{'menuitem': self.item.pk, 'quantity': 2}], format='json', headers=headers)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+        IdempotencyKey.objects.update(expires=timezone.now())
+        self.client.post('/api/cart/menu-items/bulk/',
+                         [{'menuitem': self.item.pk, 'quantity': 1}], format='json', headers=headers)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class OrderVersionTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order(self.customer, self.create_menu_items(1), delivery_crew=self.crew)
+
+    def test_if_match_rejects_stale_updates(self):
+        self.login(self.manager)
+        etag = self.client.get(f'/api/orders/{self.order.pk}')['ETag']
+        self.assertEqual(etag, '"0"')
+        response = self.client.patch(f'/api/orders/{self.order.pk}', {'status': 1}, headers={'If-Match': etag})
+        self.assertEqual((response.status_code, response['ETag']), (200, '"1"'))
+
+        self.login(self.crew)
+        response = self.client.patch(f'/api/orders/{self.order.pk}', {'status': 0}, headers={'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), (True, 1))
+
+        response = self.client.patch(f'/api/orders/{self.order.pk}', {'status': 0}, headers={'If-Match': '*'})
+        self.assertEqual((response.status_code, response['ETag']), (200, '"2"'))
+
+    def test_concurrent_writes_are_not_overwritten(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(status=True, version=F('version') + 1)
+        stale.status = False
+        self.assertFalse(views.save_order(stale, False, self.crew.pk))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), (True, 1))
+
+    def test_if_match_can_be_required(self):
+        self.login(self.manager)
+        with mock.patch.object(views, 'ORDERS_REQUIRE_IF_MATCH', True):
+            self.assertEqual(self.client.patch(f'/api/orders/{self.order.pk}', {'status': 1}).status_code, 428)
+            response = self.client.patch(f'/api/orders/{self.order.pk}', {'status': 1}, headers={'If-Match': '"0"'})
+        self.assertEqual(response.status_code, 200)
+
+
+class BulkOrderStatusTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        items = self.create_menu_items(1)
+        self.orders = [self.create_order(self.customer, items, delivery_crew=self.crew) for _ in range(3)]
+        self.other = self.create_order(self.customer, items)
+        self.login(self.crew)
+        self.client.get('/api/orders/')  # warm the role cache
+
+    def test_orders_are_updated_in_one_statement(self):
+        delivered = self.orders[2]
+        delivered.status = True
+        delivered.save()
+        ids = [order.pk for order in self.orders] + [self.other.pk, 0]
+
+        with CaptureQueriesContext(connection) as captured, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/status/', {'ids': ids, 'status': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual([result['result'] for result in response.json()['results']],
+                         ['updated', 'updated', 'unchanged', 'error', 'error'])
+
+        updates = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('UPDATE "LittleLemonAPI_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('status', 'version')),
+            [(True, 1), (True, 1), (True, 0), (False, 0)])
+        self.assertEqual(Job.objects.filter(name=jobs.ORDER_STATUS_CHANGED).count(), 2)
+
+    def test_requests_are_validated(self):
+        post = lambda data: self.client.post('/api/orders/status/', data, format='json')
+        self.assertEqual(post({'ids': [], 'status': 1}).status_code, 400)
+        self.assertEqual(post({'ids': [self.orders[0].pk], 'status': 'maybe'}).status_code, 400)
+        with mock.patch.object(views, 'ORDERS_BULK_STATUS_MAX', 2):
+            self.assertEqual(post({'ids': [order.pk for order in self.orders], 'status': 1}).status_code, 400)
+
+        self.login(self.customer)
+        self.assertEqual(post({'ids': [self.orders[0].pk], 'status': 1}).status_code, 403)
+
+
+class OrderArchiveTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        items = self.create_menu_items(2)
+        today = timezone.localdate()
+        # Oldest first: two old delivered orders, an old open one and a recent delivered one.
+        self.orders = [
+            self.create_order(self.customer, items, delivery_crew=self.crew, status=True),
+            self.create_order(self.customer, items[:1], delivery_crew=self.crew, status=True),
+            self.create_order(self.customer, items),
+            self.create_order(self.customer, items[:1], delivery_crew=self.crew, status=True),
+        ]
+        for days, order in zip((300, 200, 100, 1), self.orders):
+            Order.objects.filter(pk=order.pk).update(date=today - timedelta(days=days))
+        self.archived = [order.pk for order in self.orders[:2]]
+
+    def test_old_delivered_orders_move_in_batches(self):
+        batches = []
+        self.assertEqual(archive.archive_orders(batch_size=1, progress=batches.append), 2)
+        self.assertEqual(batches, [1, 2])
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('pk', flat=True)), self.archived)
+        self.assertEqual(ArchivedOrderItem.objects.filter(order_id=self.archived[0]).count(), 2)
+        self.assertFalse(Order.objects.filter(pk__in=self.archived).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=self.archived).exists())
+        self.assertEqual(archive.archive_orders(), 0)
+
+    def test_history_reads_both_tables(self):
+        archive.archive_orders()
+        self.login(self.customer)
+        listed = lambda url: [order['id'] for order in self.client.get(url).json()['results']]
+        newest_first = [order.pk for order in reversed(self.orders)]
+        self.assertEqual(listed('/api/orders/'), newest_first[:2])
+        self.assertEqual(listed('/api/orders/?history=1'), newest_first)
+
+        ids, url = [], '/api/orders/?history=1&page_size=3&expand=items'
+        while url:
+            body = self.client.get(url).json()
+            self.assertEqual(body['count'], 4)
+            ids += [order['id'] for order in body['results']]
+            self.assertTrue(all(order['items'] for order in body['results']))
+            url = body['next']
+        self.assertEqual(ids, newest_first)
+
+        response = self.client.get(f'/api/orders/{self.archived[0]}')
+        self.assertEqual((response.status_code, len(response.json())), (200, 2))
+        self.login(self.manager)
+        self.assertEqual(self.client.patch(f'/api/orders/{self.archived[0]}', {'status': 0}).status_code, 404)
+        response = self.client.get('/api/orders/export/?output=ndjson&history=1')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [order.pk for order in self.orders])
+
+    def test_rollups_are_rebuilt_from_both_tables(self):
+        reports.rebuild()
+        expected = list(DailySales.objects.order_by('date').values_list('date', 'orders', 'revenue', 'delivered'))
+        archive.archive_orders()
+        reports.rebuild()
+        self.assertEqual(
+            list(DailySales.objects.order_by('date').values_list('date', 'orders', 'revenue', 'delivered')), expected)
+        self.assertEqual(DailyCrewDeliveries.objects.filter(delivery_crew=self.crew).count(), 3)
+
+
+class BenchCommandTests(LittleLemonTestCase):
+
+    def test_in_process_run_reports_every_scenario(self):
+        # The test database stands in for the throwaway one the command creates.
+        command = 'LittleLemonAPI.management.commands.bench'
+        with mock.patch(f'{command}.setup_test_environment'), mock.patch(f'{command}.teardown_test_environment'), \
+                mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            out = io.StringIO()
+            # The command quiets django.request and warnings for its report.
+            self.addCleanup(logging.getLogger('django.request').setLevel, logging.getLogger('django.request').level)
+            with warnings.catch_warnings():
+                call_command('bench', iterations=2, orders=5, json_path='-', stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['mode'], 'in-process')
+        self.assertTrue(results['endpoints'])
+        for name, row in results['endpoints'].items():
+            self.assertEqual(row['server_errors'], 0, name)
+            self.assertIsNotNone(row['queries_per_request'], name)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+
+    def load(self, **environ):
+        # Re-evaluate settings.py under a clean DB_* environment.
+        base = {name: value for name, value in os.environ.items() if not name.startswith('DB_')}
+        with mock.patch.dict(os.environ, {**base, **environ}, clear=True):
+            return runpy.run_path(settings_module.__file__)
+
+    def test_sqlite_defaults_wait_for_the_lock_without_wal(self):
+        config = self.load()
+        self.assertEqual(config['DATABASES']['default']['OPTIONS'], {'timeout': 20, 'transaction_mode': 'IMMEDIATE'})
+        self.assertEqual(config['SQLITE_PRAGMAS'], {'busy_timeout': 20000})
+
+    def test_sqlite_wal_is_opt_in(self):
+        config = self.load(DB_SQLITE_WAL='1', DB_NAME='/tmp/throwaway.sqlite3')
+        self.assertEqual(config['DATABASES']['default']['NAME'], '/tmp/throwaway.sqlite3')
+        self.assertEqual(config['SQLITE_PRAGMAS'], {'busy_timeout': 20000, 'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+
+    def test_sqlite_tuning_can_be_turned_off(self):
+        config = self.load(DB_SQLITE_TUNING='0', DB_SQLITE_WAL='1')
+        self.assertNotIn('OPTIONS', config['DATABASES']['default'])
+        self.assertNotIn('SQLITE_PRAGMAS', config)
+
+    def test_postgresql_pool_disables_persistent_connections(self):
+        database = self.load(DB_ENGINE='postgresql', DB_POOL='1', DB_POOL_MAX_SIZE='4')['DATABASES']['default']
+        self.assertEqual(database['OPTIONS'], {'pool': {'min_size': 2, 'max_size': 4}})
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
@@ -0,0 +1,208 @@
+"""Rate throttles backed by shared window counters.
+
+DRF's throttles keep a list of request timestamps per client in the cache
+and rewrite it on every request: memory grows with the rate, and the
+read-modify-write loses counts when workers race. These throttles keep one
+counter per client, scope and window instead and bump it atomically, so
+every worker sharing the store enforces the same limit.
+
+``THROTTLE_WINDOW`` picks the algorithm. ``'fixed'`` counts requests per
+window (a minute, an hour...). ``'sliding'`` weights the previous window's
+count by how much of it still overlaps the last ``duration`` seconds, which
+smooths out bursts at window boundaries and still needs only two counters.
+
+``THROTTLE_STORE`` picks where the counters live. ``CacheStore`` uses
+``cache.incr()``: atomic on Redis (so shared between processes) and under a
+lock in local memory (per process only). ``DatabaseStore`` upserts one
+``ThrottleCounter`` row per client and scope, for deployments with several
+workers and no Redis.
+
+Each throttle adds ``X-RateLimit-Limit``, ``X-RateLimit-Remaining`` and
+``X-RateLimit-Reset`` (seconds) to the response; with several throttles on
+a view the headers describe the one closest to its limit.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+from .models import ThrottleCounter
+
+THROTTLE_STORE = getattr(settings, 'THROTTLE_STORE', 'LittleLemonAPI.throttling.CacheStore')
+THROTTLE_CACHE = getattr(settings, 'THROTTLE_CACHE', 'default')
+THROTTLE_WINDOW = getattr(settings, 'THROTTLE_WINDOW', 'sliding')
+THROTTLE_PRUNE_EVERY = getattr(settings, 'THROTTLE_PRUNE_EVERY', 1000)
+
+
+class CacheStore:
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or THROTTLE_CACHE]
+
+    def hit(self, key, window, duration, previous=False):
+        """Count one request in ``window``; return (this window's count, the previous window's)."""
+        current_key = f'{key}:{window}'
+        # The counter must outlive its window while it is still the "previous" one.
+        self.cache.add(current_key, 0, duration * 2)
+        try:
+            count = self.cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(current_key, 1, duration * 2)
+            count = 1
+        return count, (self.cache.get(f'{key}:{window - 1}', 0) if previous else 0)
+
+    async def ahit(self, key, window, duration, previous=False):
+        current_key = f'{key}:{window}'
+        await self.cache.aadd(current_key, 0, duration * 2)
+        try:
+            count = await self.cache.aincr(current_key)
+        except ValueError:
+            await self.cache.aset(current_key, 1, duration * 2)
+            count = 1
+        return count, (await self.cache.aget(f'{key}:{window - 1}', 0) if previous else 0)
+
+
+class DatabaseStore:
+    """One ``ThrottleCounter`` row per client and scope, updated with a single upsert.
+
+    Needs ``INSERT ... ON CONFLICT ... RETURNING``: SQLite 3.35+ or PostgreSQL.
+    """
+
+    def __init__(self):
+        self.hits = 0
+
+    def hit(self, key, window, duration, previous=False):
+        table = connection.ops.quote_name(ThrottleCounter._meta.db_table)
+        key_, period, count, prev, expires = map(
+            connection.ops.quote_name, ('key', 'period', 'count', 'previous', 'expires'))
+        # Moving to the next window keeps the old count as "previous"; a gap of
+        # more than one window resets both.
+        sql = f'''
+            INSERT INTO {table} ({key_}, {period}, {count}, {prev}, {expires})
+            VALUES (%s, %s, 1, 0, %s)
+            ON CONFLICT ({key_}) DO UPDATE SET
+                {count} = CASE WHEN {table}.{period} = excluded.{period} THEN {table}.{count} + 1 ELSE 1 END,
+                {prev} = CASE
+                    WHEN {table}.{period} = excluded.{period} THEN {table}.{prev}
+                    WHEN {table}.{period} = excluded.{period} - 1 THEN {table}.{count}
+                    ELSE 0 END,
+                {period} = excluded.{period},
+                {expires} = excluded.{expires}
+            RETURNING {count}, {prev}
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [key, window, (window + 2) * duration])
+            count, previous_count = cursor.fetchone()
+
+        self.hits += 1
+        if self.hits % THROTTLE_PRUNE_EVERY == 0:
+            self.prune()
+        return count, previous_count
+
+    async def ahit(self, key, window, duration, previous=False):
+        return await sync_to_async(self.hit)(key, window, duration, previous)
+
+    def prune(self):
+        """Delete the rows of clients that have not been seen for two windows."""
+        return ThrottleCounter.objects.filter(expires__lt=time.time()).delete()[0]
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(THROTTLE_STORE)()
+    return _store
+
+
+class CounterThrottleMixin:
+    """``allow_request()`` and ``wait()`` for DRF's ``SimpleRateThrottle`` subclasses."""
+
+    window = THROTTLE_WINDOW
+
+    def allow_request(self, request, view):
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        window, elapsed = self.position()
+        return self.decide(view, elapsed, *get_store().hit(key, window, self.duration, self.window == 'sliding'))
+
+    async def aallow_request(self, request, view):
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        window, elapsed = self.position()
+        return self.decide(view, elapsed, *await get_store().ahit(key, window, self.duration, self.window == 'sliding'))
+
+    def get_key(self, request, view):
+        if self.rate is None:
+            return None
+        return self.get_cache_key(request, view)
+
+    def position(self):
+        now = self.timer()
+        window = int(now // self.duration)
+        return window, now - window * self.duration
+
+    def decide(self, view, elapsed, count, previous):
+        remaining_fraction = 1 - elapsed / self.duration
+        if self.window == 'sliding':
+            used = previous * remaining_fraction + count
+        else:
+            used = count
+        self.wait_seconds = self.time_to_allow(count, previous, elapsed)
+
+        remaining = max(0, int(self.num_requests - used))
+        headers = view.headers
+        if 'X-RateLimit-Remaining' not in headers or remaining < int(headers['X-RateLimit-Remaining']):
+            headers['X-RateLimit-Limit'] = str(self.num_requests)
+            headers['X-RateLimit-Remaining'] = str(remaining)
+            headers['X-RateLimit-Reset'] = str(max(1, round(self.duration - elapsed)))
+        return used <= self.num_requests
+
+    def time_to_allow(self, count, previous, elapsed):
+        # Seconds until one more request would fit.
+        until_next_window = self.duration - elapsed
+        if self.window != 'sliding':
+            return until_next_window if count >= self.num_requests else 0
+        # Either later in this window, once previous * (1 - (elapsed + t) / duration)
+        # has decayed to the room left...
+        room = self.num_requests - 1 - count
+        if room >= 0:
+            if previous <= room:
+                return 0
+            wait = self.duration * (1 - room / previous) - elapsed
+            if wait <= until_next_window:
+                return max(0.0, wait)
+        # ...or in the next one, where this window's count becomes "previous".
+        return until_next_window + max(0.0, self.duration * (1 - (self.num_requests - 1) / count))
+
+    def wait(self):
+        return self.wait_seconds or None
+
+
+class AnonRateThrottle(CounterThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(CounterThrottleMixin, throttling.UserRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(CounterThrottleMixin, throttling.ScopedRateThrottle):
+    """Applies ``DEFAULT_THROTTLE_RATES[view.throttle_scope]`` to views that set one."""
+
+    def get_key(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return None
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().get_key(request, view)
@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 from rest_framework.authtoken.views import obtain_auth_token
 
+
+def read_view(view_class, async_view_name):
+    # Under ASGI with ASYNC_READS on, GET and HEAD go to the async twin.
+    if not getattr(settings, 'ASYNC_READS', False):
+        return view_class.as_view()
+    return async_views.read_view(view_class, getattr(async_views, async_view_name))
+
+
 urlpatterns = [
-    path('menu-items/', views.MenuItemsView.as_view()),
-    path('menu-items/<int:pk>', views.SingleMenuItem.as_view()),
+    path('menu-items/', read_view(views.MenuItemsView, 'MenuItemsView')),
+    path('menu-items/<int:pk>', read_view(views.SingleMenuItem, 'SingleMenuItem')),
     path('cart/menu-items/', views.CartView.as_view()),
+    path('cart/menu-items/bulk/', views.CartBulkView.as_view()),
     path('groups/manager/users/', views.manager_view),
     path('groups/manager/users/<user_id>/', views.managers),
     path('groups/delivery-crew/users/', views.deliverycrew_view),
     path('groups/delivery-crew/users/<user_id>/', views.deliverycrew),
-    path('category/', views.MenuCategoryView.as_view()),
-    path('orders/', views.OrderView.as_view()),
+    path('category/', read_view(views.MenuCategoryView, 'MenuCategoryView')),
+    path('orders/', read_view(views.OrderView, 'OrderView')),
+    path('orders/export/', views.export_orders),
+    path('orders/dispatch/', views.dispatch_orders),
+    path('orders/status/', views.orders_status),
+    path('orders/events/', async_views.OrderEventsView.as_view()),
     path('orders/<order_id>', views.OrderItemView.as_view()),
+    path('jobs/dead/', views.dead_jobs),
+    path('reports/daily/', views.daily_sales_report),
+    path('reports/menu-items/', views.menu_item_sales_report),
+    path('reports/crew/', views.crew_deliveries_report),
     #path('throttle-check/', views.throttle_check),
     
 ]
\ No newline at end of file
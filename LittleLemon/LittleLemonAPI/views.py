@@ -1,48 +1,81 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import F, Prefetch
 from django.shortcuts import render
-from rest_framework import generics, status, viewsets, permissions
-from .models import MenuItem, Category, Cart, Order, OrderItem
-from .serializers import MenuItemSerializer, CategorySerializer, CartSerializer, UserSerializer, OrderItemSerializer, OrderSerializer
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from rest_framework import filters, generics, status, viewsets, permissions
+from .models import MenuItem, Category, Cart, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Job
+from .serializers import MenuItemSerializer, CategorySerializer, CartSerializer, UserSerializer, OrderItemSerializer, OrderSerializer, JobSerializer, wants_items
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.core.paginator import Paginator, EmptyPage
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from django.contrib.auth.models import User, Group
 from .permissions import GroupPermission, UserPerimission, IsManagerOrFullAccess
+from .catalogue import CatalogueCacheMixin, CategorySnapshotMixin, MenuItemSnapshotMixin, SnapshotMixin
+from .archive import wants_history
+from .cart import bulk_update_cart
+from .checkout import checkout
+from .delivery import bulk_update_status
+from .dispatch import dispatch
+from .jobs import ORDER_STATUS_CHANGED, enqueue, requeue
+from .pagination import KeysetPagination
+from .push import order_changed
+from .export import filter_orders, stream_csv, stream_ndjson
+from .fastpath import FastListMixin, CartValues, MenuItemValues, OrderItemValues
+from .idempotency import idempotent
+from . import reports
+from .roles import is_manager, is_delivery_crew
+from .search import MenuSearchFilter
 
 # Create your views here.
 
-class MenuCategoryView(generics.ListCreateAPIView):
+CART_BULK_MAX_LINES = getattr(settings, 'CART_BULK_MAX_LINES', 100)
+JOBS_DEAD_LETTER_LIMIT = getattr(settings, 'JOBS_DEAD_LETTER_LIMIT', 100)
+REPORTS_TOP_ITEMS = getattr(settings, 'REPORTS_TOP_ITEMS', 10)
+ORDERS_REQUIRE_IF_MATCH = getattr(settings, 'ORDERS_REQUIRE_IF_MATCH', False)
+ORDERS_BULK_STATUS_MAX = getattr(settings, 'ORDERS_BULK_STATUS_MAX', 100)
+
+class MenuCategoryView(CatalogueCacheMixin, CategorySnapshotMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated, GroupPermission]
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class MenuItemsView(generics.ListCreateAPIView):
+class MenuItemsView(CatalogueCacheMixin, MenuItemSnapshotMixin, FastListMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated, GroupPermission]
-    queryset = MenuItem.objects.all()
+    queryset = MenuItem.objects.select_related('category')
     serializer_class = MenuItemSerializer
+    fast_serializer = MenuItemValues
+    filter_backends = [MenuSearchFilter, filters.OrderingFilter]
     
-class SingleMenuItem(generics.RetrieveUpdateAPIView, generics.DestroyAPIView):
+class SingleMenuItem(CatalogueCacheMixin, SnapshotMixin, generics.RetrieveUpdateAPIView, generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, GroupPermission]
-    queryset = MenuItem.objects.all()
+    queryset = MenuItem.objects.select_related('category')
     serializer_class = MenuItemSerializer
 
-class CartView(generics.ListCreateAPIView):
+class CartView(FastListMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CartSerializer
+    fast_serializer = CartValues
 
     def get_queryset(self):
         user = self.request.user
-        return Cart.objects.filter(user=user)
+        return Cart.objects.filter(user=user).select_related('menuitem')
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        menuitem_id = self.request.data.get('menuitem')
-        quantity = self.request.data.get('quantity')
-
-        if menuitem_id and quantity:
-            menuitem = MenuItem.objects.get(pk=menuitem_id)
-            unit_price = menuitem.price
+        # Priced from the menu item the serializer loaded to validate the
+        # request: the catalogue snapshot may be behind another worker's edit.
+        unit_price = serializer.validated_data['menuitem'].price
         cart = serializer.save(user=self.request.user, unit_price=unit_price)
         cart.price = cart.unit_price * cart.quantity
         cart.save()
@@ -58,41 +91,97 @@ class CartView(generics.ListCreateAPIView):
             return Response({"message": "All items have been deleted from the cart."}, status=status.HTTP_204_NO_CONTENT)
     
         return Response({"error": "You don't have permission to delete this cart."}, status=status.HTTP_403_FORBIDDEN)
+
+class CartBulkView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'ten'
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        lines = request.data.get('lines') if isinstance(request.data, dict) else request.data
+        if not isinstance(lines, list) or not lines:
+            return Response({"error": "Please provide a non-empty list of lines."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(lines) > CART_BULK_MAX_LINES:
+            return Response({"error": f"At most {CART_BULK_MAX_LINES} lines can be sent at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_update_cart(request.user, lines)
+        return Response({"results": results}, status=status.HTTP_200_OK)
     
 class OrderView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsManagerOrFullAccess]
     serializer_class = OrderSerializer
-    queryset = Order.objects.all()
+    pagination_class = KeysetPagination
+    queryset = Order.objects.select_related('delivery_crew')
 
     def get_queryset(self):
-        user = self.request.user
+        queryset = super().get_queryset()
+        if wants_items(self.request):
+            queryset = queryset.prefetch_related(
+                Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menuitem')))
+        return self.visible(queryset)
+
+    def get_archive_queryset(self):
+        queryset = ArchivedOrder.objects.select_related('delivery_crew')
+        if wants_items(self.request):
+            queryset = queryset.prefetch_related(
+                Prefetch('orderitem_set', queryset=ArchivedOrderItem.objects.select_related('menuitem')))
+        return self.visible(queryset)
 
-        if user.groups.filter(name="Manager").exists():
-            return Order.objects.all()
+    def visible(self, queryset):
+        user = self.request.user
+        if is_manager(user):
+            return queryset
         
-        if user.groups.filter(name="Delivery crew").exists():
-            return Order.objects.filter(delivery_crew__isnull=False)
+        if is_delivery_crew(user):
+            return queryset.filter(delivery_crew__isnull=False)
         
-        return Order.objects.filter(user=user)
+        return queryset.filter(user=user)
+
+    def list(self, request, *args, **kwargs):
+        if not wants_history(request):
+            return super().list(request, *args, **kwargs)
+        querysets = [self.filter_queryset(self.get_queryset()), self.get_archive_queryset()]
+        page = self.paginator.paginate_querysets(querysets, request, view=self)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        cart_items = Cart.objects.filter(user=self.request.user)
-        total = sum(cart_item.price for cart_item in cart_items)
-        order = serializer.save(user=self.request.user, total=total)
-
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                menuitem=cart_item.menuitem,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                price=cart_item.price,
-            )
-        cart_items.delete()
-
-        return order
+        user = self.request.user
+        return checkout(user, lambda **summary: serializer.save(user=user, **summary))
     
 
+def order_etag(order):
+    return f'"{order.version}"'
+
+
+def save_order(order, previous_status, previous_crew_id):
+    # Publish changes in the same transaction as the save. Clients send "1",
+    # 1 or true, so compare the status as the field stores it.
+    #
+    # The write only applies if the order is still at the version that was
+    # read, so a concurrent update is reported (False) rather than silently
+    # overwritten; no row lock is held while the request is handled.
+    order.status = Order._meta.get_field('status').to_python(order.status)
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, version=order.version).update(
+            status=order.status, delivery_crew_id=order.delivery_crew_id, version=F('version') + 1)
+        if not updated:
+            return False
+        order.version += 1
+        # Reassigning a delivered order moves its delivery in the rollups too.
+        if order.status != previous_status or (
+                order.status and order.delivery_crew_id != previous_crew_id):
+            enqueue(ORDER_STATUS_CHANGED, order_id=order.pk, status=order.status,
+                    delivery_crew=order.delivery_crew_id,
+                    previous_status=previous_status, previous_crew=previous_crew_id)
+        if order.status != previous_status or order.delivery_crew_id != previous_crew_id:
+            order_changed(order)
+    return True
+
+
 class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
     #queryset = OrderItem.objects.all()
@@ -105,9 +194,13 @@ class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
             order = Order.objects.get(id=order_id)
             #return OrderItem.objects.filter(order=order)
         except Order.DoesNotExist:
-            return None
-        if user.groups.filter(name="Manager").exists() or order.user == user:
-            return OrderItem.objects.filter(order=order)
+            # Archived orders stay readable (see archive.py).
+            order = ArchivedOrder.objects.filter(id=order_id).first()
+            if order is None:
+                return None
+        if is_manager(user) or order.user_id == user.pk:
+            self.order = order
+            return order.orderitem_set.select_related('menuitem')
         
         return None
 
@@ -115,27 +208,51 @@ class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
         try:
             queryset = self.get_queryset()
             if queryset is not None:
-                serializer = OrderItemSerializer(queryset, many=True)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return Response(OrderItemValues.many(OrderItemValues.values(queryset)), status=status.HTTP_200_OK,
+                                headers={'ETag': order_etag(self.order)})
             else:
                 return Response({"error": "Order not found or does not belong to current user."}, status=status.HTTP_404_NOT_FOUND)
         except Order.DoesNotExist as e:
             return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
     
+    def check_version(self, request, order):
+        # If-Match against the order's ETag; returns an error response or None.
+        if_match = request.headers.get('If-Match')
+        if if_match is None:
+            if ORDERS_REQUIRE_IF_MATCH:
+                return Response({"error": "Send the order's ETag in an If-Match header."},
+                                status=status.HTTP_428_PRECONDITION_REQUIRED)
+            return None
+        tags = parse_etags(if_match)
+        if '*' not in tags and order_etag(order) not in tags:
+            return self.changed(request)
+        return None
+
+    def changed(self, request):
+        if 'If-Match' in request.headers:
+            return Response({"error": "The order has been changed since it was read. Fetch it and try again."},
+                            status=status.HTTP_412_PRECONDITION_FAILED)
+        return Response({"error": "The order was changed by another request. Fetch it and try again."},
+                        status=status.HTTP_409_CONFLICT)
+
     def update_order(self, request, order):
-        user = request.user    
+        user = request.user
+        previous_status, previous_crew_id = order.status, order.delivery_crew_id
         # Check if the user is a manager or the owner of the order
         #if not request.user.groups.filter(name="Manager").exists() and order.user != request.user:
         #    return Response({"error": "You don't have permission to modify this order."}, status=status.HTTP_403_FORBIDDEN)
         
         # Update delivery_crew and status if provided in the request data
-        if user.groups.filter(name='Manager').exists():
+        if is_manager(user):
+            error = self.check_version(request, order)
+            if error is not None:
+                return error
             delivery_crew_id = request.data.get('delivery_crew')
 
             if delivery_crew_id:
                 try:
                     delivery_crew = User.objects.get(pk=delivery_crew_id)
-                    if not delivery_crew.groups.filter(name="Delivery crew").exists():
+                    if not is_delivery_crew(delivery_crew):
                         return Response(
                             {"error": "The selected user is not a member of the Delivery crew group."},
                             status=status.HTTP_403_FORBIDDEN
@@ -149,17 +266,23 @@ class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
             if status_value:
                 order.status = status_value
 
-            order.save()
-            serializer = OrderItemSerializer(order.orderitem_set.all(), many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            if not save_order(order, previous_status, previous_crew_id):
+                return self.changed(request)
+            items = OrderItemValues.values(order.orderitem_set.all())
+            return Response(OrderItemValues.many(items), status=status.HTTP_200_OK, headers={'ETag': order_etag(order)})
         
-        elif user.groups.filter(name='Delivery crew').exists():
+        elif is_delivery_crew(user):
             status_value = request.data.get('status')
 
             if status_value:
+                error = self.check_version(request, order)
+                if error is not None:
+                    return error
                 order.status = status_value
-                order.save()
-                return Response({"message": "Order status updated successfully."}, status=status.HTTP_200_OK)
+                if not save_order(order, previous_status, previous_crew_id):
+                    return self.changed(request)
+                return Response({"message": "Order status updated successfully."}, status=status.HTTP_200_OK,
+                                headers={'ETag': order_etag(order)})
         return Response({"error": "You don't have permission to modify this order."}, status=status.HTTP_403_FORBIDDEN)
         
 
@@ -182,7 +305,7 @@ class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
     
     def delete_order(self, request, order):
         # Check if the user is a manager or the owner of the order
-        if not request.user.groups.filter(name="Manager").exists():
+        if not is_manager(request.user):
             return Response({"error": "You don't have permission to delete this order."}, status=status.HTTP_403_FORBIDDEN)
 
         # Delete the order
@@ -204,21 +327,164 @@ class OrderItemView(generics.ListAPIView, generics.DestroyAPIView):
 
         
   
-     
+@api_view(['GET'])
+@permission_classes({IsAuthenticated})
+def export_orders(request):
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    params = request.query_params
+    output = params.get('output', 'csv')
+    if output not in ('csv', 'ndjson'):
+        return Response({"error": "output must be 'csv' or 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+
+    filters = {}
+    for name in ('date_from', 'date_to'):
+        if name in params:
+            filters[name] = parse_date(params[name])
+            if filters[name] is None:
+                return Response({"error": f"{name} must be a date in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+    if 'status' in params:
+        filters['status'] = params['status'].lower() in ('1', 'true')
+    if 'delivery_crew' in params:
+        if not params['delivery_crew'].isdigit():
+            return Response({"error": "delivery_crew must be a user id."}, status=status.HTTP_400_BAD_REQUEST)
+        filters['delivery_crew'] = int(params['delivery_crew'])
+
+    querysets = [filter_orders(**filters)]
+    if wants_history(request):
+        querysets.append(filter_orders(archived=True, **filters))
+    if output == 'csv':
+        response = StreamingHttpResponse(stream_csv(*querysets), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(stream_ndjson(*querysets), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="orders.{output}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes({IsAuthenticated})
+def dispatch_orders(request):
+    # Spread every unassigned open order (or the oldest "limit" of them)
+    # across the delivery crew by open-order count.
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    limit = request.data.get('limit')
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0):
+        return Response({"error": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    assignments = dispatch(limit)
+    return Response({
+        "assigned": len(assignments),
+        "assignments": [{"order": order_id, "delivery_crew": crew_id} for order_id, crew_id in assignments],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes({IsAuthenticated})
+def orders_status(request):
+    # A delivery crew member sets the status of several of their orders at
+    # once: {"ids": [...], "status": 1}. Each id gets its own result.
+    if not is_delivery_crew(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return Response({"error": "Please provide a non-empty list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > ORDERS_BULK_STATUS_MAX:
+        return Response({"error": f"At most {ORDERS_BULK_STATUS_MAX} orders can be updated at once."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        status_value = Order._meta.get_field('status').to_python(request.data.get('status'))
+    except DjangoValidationError:
+        return Response({"error": "status must be 0 or 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = bulk_update_status(request.user, ids, status_value)
+    updated = sum(result["result"] == "updated" for result in results)
+    return Response({"updated": updated, "results": results}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes({IsAuthenticated})
+def dead_jobs(request):
+    # The dead-letter queue: jobs that used up their attempts. POST {"ids": [...]}
+    # gives them a fresh set of attempts.
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    if request.method == 'POST':
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({"error": "Please provide a list of job ids."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"requeued": requeue(ids)}, status=status.HTTP_200_OK)
+
+    jobs = Job.objects.filter(status=Job.DEAD).order_by('-finished', '-id')[:JOBS_DEAD_LETTER_LIMIT]
+    return Response(JobSerializer(jobs, many=True).data, status=status.HTTP_200_OK)
+
+
+def report_dates(params):
+    # Returns (filters, error response) for the date_from/date_to of a report.
+    filters = {}
+    for name, lookup in (('date_from', 'date__gte'), ('date_to', 'date__lte')):
+        if name in params:
+            filters[lookup] = parse_date(params[name])
+            if filters[lookup] is None:
+                error = {"error": f"{name} must be a date in YYYY-MM-DD format."}
+                return None, Response(error, status=status.HTTP_400_BAD_REQUEST)
+    return filters, None
+
+
+@api_view(['GET'])
+@permission_classes({IsAuthenticated})
+def daily_sales_report(request):
+    # Orders, items, revenue and deliveries per day, read from the rollups.
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+    filters, error = report_dates(request.query_params)
+    if error:
+        return error
+    return Response(reports.daily(**filters), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes({IsAuthenticated})
+def menu_item_sales_report(request):
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+    filters, error = report_dates(request.query_params)
+    if error:
+        return error
+    limit = request.query_params.get('limit', str(REPORTS_TOP_ITEMS))
+    if not limit.isdigit() or int(limit) == 0:
+        return Response({"error": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(reports.top_menu_items(int(limit), **filters), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes({IsAuthenticated})
+def crew_deliveries_report(request):
+    if not is_manager(request.user):
+        return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
+    filters, error = report_dates(request.query_params)
+    if error:
+        return error
+    return Response(reports.crew_deliveries(**filters), status=status.HTTP_200_OK)
+
+
 @api_view(['GET', 'POST'])                                                                                        
 @permission_classes({IsAuthenticated})                                                              
 def manager_view(request):
     try:
         managers_group = Group.objects.get(name="Manager")
         if request.method == 'GET':
-            if request.user.groups.filter(name='Manager').exists():
+            if is_manager(request.user):
                 managers = User.objects.filter(groups=managers_group)
                 serializer = UserSerializer(managers, many=True)
                 return Response(serializer.data)
             else:
                 return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
         elif request.method == 'POST':
-            if request.user.groups.filter(name='Manager').exists():
+            if is_manager(request.user):
                 data = request.data
                 username = data.get('username', None)
                 if not username:
@@ -240,7 +506,7 @@ def manager_view(request):
 def managers(request, user_id):
    
     if request.method == 'DELETE':
-        if request.user.groups.filter(name='Manager').exists():
+        if is_manager(request.user):
             try:
                 user = get_object_or_404(User, id=user_id)
                 managers_group = Group.objects.get(name='Manager')
@@ -259,14 +525,14 @@ def deliverycrew_view(request):
     try:
         deliverycrew_group = Group.objects.get(name="Delivery crew")
         if request.method == 'GET':
-            if request.user.groups.filter(name='Manager').exists():
+            if is_manager(request.user):
                 deliverycrew = User.objects.filter(groups=deliverycrew_group)
                 serializer = UserSerializer(deliverycrew, many=True)
                 return Response(serializer.data)
             else:
                 return Response({"message": "You are not authorized"}, status=status.HTTP_403_FORBIDDEN)
         elif request.method == 'POST':
-            if request.user.groups.filter(name='Manager').exists():
+            if is_manager(request.user):
                 data = request.data
                 username = data.get('username', None)
                 if not username:
@@ -288,7 +554,7 @@ def deliverycrew_view(request):
 def deliverycrew(request, user_id):
    
     if request.method == 'DELETE':
-        if request.user.groups.filter(name='Manager').exists():
+        if is_manager(request.user):
             try:
                 user = get_object_or_404(User, id=user_id)
                 deliverycrew_group = Group.objects.get(name='Delivery crew')